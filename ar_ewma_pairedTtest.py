@@ -1,40 +1,43 @@
-import csv
 import numpy as np
-import pandas as pd
 import math
-from numpy.linalg import inv
-from numpy import dtype
 import matplotlib.pyplot as plt
-from matplotlib.pyplot import figure
+from autoregression import ar_holdout
+from dataset_registry import DatasetRegistry
+from ewma import ewma_holdout
+from metrics import mape, mse
+from preprocessing import get_date_range
 
 
-def part_e_d():
-    #read the cleaned vaccination dataset for florida
-    df_fl = pd.read_csv('./processed/clean_fl_vax.csv')
+def part_e_d(registry: DatasetRegistry = None):
+    if registry is None:
+        registry = DatasetRegistry.from_processed_csv(kinds=['vax'])
 
-    #read the cleaned vaccination dataset for Connecticut
-    df_ct = pd.read_csv('./processed/clean_ct_vax.csv')
-    df_fl.Date = pd.to_datetime(df_fl.Date)
+    #cleaned vaccination dataset for florida
+    df_fl = registry.get('FL', 'vax')
+
+    #cleaned vaccination dataset for Connecticut
+    df_ct = registry.get('CT', 'vax')
 
     df_fl = df_fl.sort_values(by='Date')
-    df_ct.Date = pd.to_datetime(df_ct.Date)
     df_ct = df_ct.sort_values(by='Date')
 
     #get number of covid vaccinations administered for month of may
-    may_df_FL = df_fl[(df_fl['Date'] >= '2021-05-01') & (df_fl['Date'] <= '2021-05-31')]
-    may_df_CT = df_ct[(df_ct['Date'] >= '2021-05-01') & (df_ct['Date'] <= '2021-05-31')]
+    may_df_FL = get_date_range(df_fl, '2021-05-01', '2021-05-31', 'Date')
+    may_df_CT = get_date_range(df_ct, '2021-05-01', '2021-05-31', 'Date')
     may_FL = may_df_FL[['Date','Administered']]
     may_CT = may_df_CT[['Date','Administered']]
 
     #get number of vaccines administered for month of september
-    sept_df_FL = df_fl[(df_fl['Date'] >= '2021-09-01') & (df_fl['Date'] <= '2021-09-30') ]
-    sept_df_CT = df_ct[(df_ct['Date'] >= '2021-09-01') & (df_ct['Date'] <= '2021-09-30') & (df_ct['Date'] != '2021-09-08')]
+    sept_df_FL = get_date_range(df_fl, '2021-09-01', '2021-09-30', 'Date')
+    sept_df_CT = get_date_range(df_ct, '2021-09-01', '2021-09-30', 'Date')
+    sept_df_CT = sept_df_CT[sept_df_CT['Date'] != '2021-09-08']
     sept_FL = sept_df_FL[['Administered']]
     sept_CT = sept_df_CT[['Administered']]
 
     #get number of vaccines administered for month of november
-    nov_df_FL = df_fl[(df_fl['Date'] >= '2021-11-01') & (df_fl['Date'] <= '2021-11-30') & (df_fl['Date'] != '2021-11-29')]
-    nov_df_CT = df_ct[(df_ct['Date'] >= '2021-11-01') & (df_ct['Date'] <= '2021-11-30')]
+    nov_df_FL = get_date_range(df_fl, '2021-11-01', '2021-11-30', 'Date')
+    nov_df_FL = nov_df_FL[nov_df_FL['Date'] != '2021-11-29']
+    nov_df_CT = get_date_range(df_ct, '2021-11-01', '2021-11-30', 'Date')
     nov_FL = nov_df_FL[['Administered']]
     nov_CT = nov_df_CT[['Administered']]
 
@@ -52,49 +55,15 @@ def part_e_d():
 
     #function to calculate MSE
     def MSE(Y_act, Y_pred):
-        SSE = 0
-        Y_sse = Y_act-Y_pred
-        for i in range(0,len(Y_pred)):
-            SSE = SSE + Y_sse[i]*Y_sse[i]
-        return SSE/len(Y_act)
+        return mse(Y_act, Y_pred)
 
-    #function to calculate MAPE
+    #function to calculate MAPE, days with no vaccines administered are left out
     def MAPE(Y_act,Y_pred):
-        err = (abs(Y_act-Y_pred))/Y_act
-        MAPE = 0
-        for i in range(0, len(Y_act)):
-            MAPE = MAPE + err[i]
-        return 100*MAPE/len(Y_act)
-
-    #function to calculate Beta
-    def Beta(x,y):
-        return np.matmul(np.matmul(inv(np.matmul(np.transpose(x),x)),np.transpose(x)),y)
+        return mape(Y_act, Y_pred, zero_handling='skip')
 
     #function to calculate auto regression
     def AR(data, p):
-        n_data = data.to_numpy()
-        x_train = []
-        y_train = []
-        y_pred = []
-        n_3 = n_data[:-7]
-        n_1 = n_data[-7:]
-        y_act = n_1
-
-        for i in range(len(n_3)-p):
-            x_train = x_train + [n_3[i:i+p]]
-            y_train = y_train + [n_3[i+p]]
-        one_app = np.ones((len(x_train),),dtype=int)
-        one_app = np.reshape(one_app,(len(one_app),1))
-        x_train = np.append(one_app , x_train, axis = 1)
-        beta = Beta(x_train,y_train)
-        x = []
-        for i in range(len(n_data)-7,len(n_data)):
-            x = [n_data[i-p:i]]
-            x = np.append([1],x)
-            y = np.matmul(x,beta)
-            y_pred = y_pred + [y]
-        y_pred = np.reshape(y_pred,(len(y_act),))
-        return y_pred,y_act
+        return ar_holdout(data.to_numpy(), p, holdout=7)
 
 
     #AR results for florida state
@@ -143,12 +112,7 @@ def part_e_d():
 
     #function to calculate EWMA
     def EWMA(data, alpha):
-        n_data = data.to_numpy()
-        Y_pred = [n_data[0]]
-        for i in range(1,len(n_data)):
-            Y_pred = np.append(Y_pred , [(alpha*n_data[i-1] +(1-alpha)*Y_pred[i-1])])
-        Y_pred,Y_act = np.array(Y_pred[-7:]),np.array(n_data[-7:])
-        return Y_pred,Y_act
+        return ewma_holdout(data.to_numpy(), alpha, holdout=7)
 
     #EWMA results for florida with alpha = 0.5
     y_pred_Fl_EWMA_a, y_act_Fl_EWMA_a = EWMA(may_FL['Administered'],0.5)
@@ -0,0 +1,62 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def get_lag_matrix(values, p):
+    """
+    Lagged design of an AR(p) model: row i holds values[i:i+p] (oldest to newest) and its target is values[i+p].
+    The rows are a strided view of the values, nothing is copied.
+
+    :param values: 1-D array of values, in time order
+    :param p: number of lags
+    :return: (lags of shape (len(values) - p, p), targets)
+    """
+    values = np.asarray(values, dtype=float)
+    return sliding_window_view(values, p)[:-1], values[p:]
+
+
+def fit_ar(values, p):
+    """
+    Least squares fit of an AR(p) model with intercept.
+    Solved with lstsq (SVD) instead of inverting X'X, so ill-conditioned windows (e.g. flat stretches of data)
+    still give a (minimum norm) solution.
+
+    :param values: 1-D array of values to fit on, in time order
+    :param p: number of lags
+    :return: coefficients [intercept, coefficients of the lags from oldest to newest]
+    """
+    lags, targets = get_lag_matrix(values, p)
+    design = np.empty((len(lags), p + 1))
+    design[:, 0] = 1
+    design[:, 1:] = lags
+    beta, _, _, _ = np.linalg.lstsq(design, targets, rcond=None)
+    return beta
+
+
+def predict_ar(values, beta, start):
+    """
+    One step ahead predictions of values[start:], each made from the actual p values before it
+
+    :param values: 1-D array of values, in time order
+    :param beta: coefficients from fit_ar
+    :param start: index of the first value to predict (at least p)
+    :return: array of predictions
+    """
+    values = np.asarray(values, dtype=float)
+    p = len(beta) - 1
+    lags = sliding_window_view(values[start - p:-1], p) if start < len(values) else np.empty((0, p))
+    return beta[0] + lags @ beta[1:]
+
+
+def ar_holdout(values, p, holdout=7):
+    """
+    Fit an AR(p) model on all but the last holdout values and predict each of them
+
+    :param values: 1-D array of values, in time order
+    :param p: number of lags
+    :param holdout: number of values held out at the end
+    :return: (predictions, actual values) of the held out values
+    """
+    values = np.asarray(values, dtype=float)
+    beta = fit_ar(values[:-holdout], p)
+    return predict_ar(values, beta, len(values) - holdout), values[-holdout:]
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+from autoregression import get_lag_matrix, predict_ar
+from metrics import mape, mse
+from parallel import map_tasks
+
+
+def get_rolling_origins(num_values, min_train_size, horizon=7, step=7):
+    """
+    :param num_values: length of the series
+    :param min_train_size: number of values the first model is fitted on
+    :param horizon: number of values predicted from each origin
+    :param step: number of values between consecutive origins
+    :return: array of origins, each the index of the first predicted value (= size of the training data)
+    """
+    return np.arange(min_train_size, num_values - horizon + 1, step)
+
+
+def backtest_ar(values, p, origins, horizon=7):
+    """
+    Rolling origin evaluation of an AR(p) model with intercept.
+    The normal equations (X'X, X'y, y'y) are updated with the rows that become available as the origin moves
+    forward (a sum of rank-one updates), instead of refitting on the whole history at every origin.
+
+    :param values: 1-D array of values, in time order
+    :param p: number of lags
+    :param origins: increasing origins from get_rolling_origins
+    :param horizon: number of values predicted (one step ahead, from actual values) from each origin
+    :return: array of shape (origins, 3) with the MSE, MAPE and (in-sample) AIC at each origin
+    """
+    origins = np.asarray(origins)
+    values = np.asarray(values, dtype=float)
+    lags, targets = get_lag_matrix(values, p)
+    xtx = np.zeros((p + 1, p + 1))
+    xty = np.zeros(p + 1)
+    yty = 0.0
+    num_rows = 0
+
+    # predictions of all the origins, scored together at the end
+    y_act = values[origins[:, np.newaxis] + np.arange(horizon)]
+    y_pred = np.full((len(origins), horizon), np.nan)
+    aic = np.full(len(origins), np.nan)
+    for i, origin in enumerate(origins):
+        # rows whose target is before the origin and which have not been added yet
+        new_rows = slice(num_rows, max(origin - p, num_rows))
+        new_x = np.column_stack([np.ones(new_rows.stop - new_rows.start), lags[new_rows]])
+        new_y = targets[new_rows]
+        xtx += new_x.T @ new_x
+        xty += new_x.T @ new_y
+        yty += new_y @ new_y
+        num_rows = new_rows.stop
+        if num_rows <= p + 1:
+            continue
+
+        beta, _, _, _ = np.linalg.lstsq(xtx, xty, rcond=None)
+        y_pred[i] = predict_ar(values[:origin + horizon], beta, origin)
+        # residual sum of squares of the fit, from the normal equations
+        rss = max(yty - 2 * beta @ xty + beta @ xtx @ beta, np.finfo(float).tiny)
+        aic[i] = num_rows * np.log(rss / num_rows) + 2 * (p + 1)
+    return np.column_stack([mse(y_act, y_pred), mape(y_act, y_pred), aic])
+
+
+def compute_backtest_task(task):
+    """
+    :param task: (values, p, origins, horizon)
+    :return: array of shape (origins, 3) from backtest_ar
+    """
+    values, p, origins, horizon = task
+    return backtest_ar(values, p, origins, horizon)
+
+
+def run_ar_backtests(data, col_name, p_values, min_train_size, horizon=7, step=7, states=None,
+                     location_col_name='state', date_col_name='submission_date', num_workers=1):
+    """
+    Backtest AR(p) models for every state x p over rolling origins.
+    The state x p jobs are independent and spread over a pool of worker processes, the origins of a job share the
+    incremental normal equations.
+
+    :param data: dataframe with data of one or more states
+    :param col_name: column to model
+    :param p_values: orders to evaluate
+    :param min_train_size: number of values the first model is fitted on
+    :param horizon: number of values predicted from each origin
+    :param step: number of values between consecutive origins
+    :param states: states to evaluate, None for every state in the data
+    :param location_col_name: location column name
+    :param date_col_name: date column name
+    :param num_workers: number of worker processes
+    :return: dataframe with one row per state x p x origin (state, p, origin_date, mse, mape, aic)
+    """
+    if states is not None:
+        data = data[data[location_col_name].isin(states)]
+    data = data.sort_values(by=[location_col_name, date_col_name], kind='stable')
+
+    jobs = []
+    for state, state_data in data.groupby(location_col_name, sort=True):
+        values = state_data[col_name].to_numpy(dtype=float)
+        origins = get_rolling_origins(len(values), min_train_size, horizon=horizon, step=step)
+        origin_dates = state_data[date_col_name].to_numpy()[origins]
+        for p in p_values:
+            jobs.append((state, p, origin_dates, (values, p, origins, horizon)))
+
+    all_scores = map_tasks(compute_backtest_task, [task for _, _, _, task in jobs], num_workers)
+    return pd.DataFrame({
+        location_col_name: np.concatenate([[state] * len(origin_dates) for state, _, origin_dates, _ in jobs]),
+        'p': np.concatenate([[p] * len(origin_dates) for _, p, origin_dates, _ in jobs]),
+        'origin_date': np.concatenate([origin_dates for _, _, origin_dates, _ in jobs]),
+        'mse': np.concatenate([scores[:, 0] for scores in all_scores]),
+        'mape': np.concatenate([scores[:, 1] for scores in all_scores]),
+        'aic': np.concatenate([scores[:, 2] for scores in all_scores]),
+    })
+
+
+def get_score_grid(scores, metric='mse', location_col_name='state'):
+    """
+    :param scores: dataframe from run_ar_backtests
+    :param metric: 'mse', 'mape' or 'aic'
+    :return: dataframe of the metric averaged over the origins, with one row per state and one column per p
+    """
+    return scores.groupby([location_col_name, 'p'])[metric].mean().unstack('p')
+
+
+def select_ar_order(scores, metric='mse', location_col_name='state'):
+    """
+    :param scores: dataframe from run_ar_backtests
+    :param metric: 'mse', 'mape' or 'aic'
+    :return: series with the order p with the lowest average metric for each state
+    """
+    return get_score_grid(scores, metric=metric, location_col_name=location_col_name).idxmin(axis=1)
@@ -1,139 +1,304 @@
-import scipy.special
+import json
+import os
 import scipy.stats as stats
 import matplotlib.pyplot as plt
 import numpy as np
+import pandas as pd
 from matplotlib.pyplot import figure
+from results import PosteriorResult
 
+# first day of the 4 weeks of data used for the prior, followed by the weeks the posterior is updated with
+PRIOR_START_DATE = '2020-06-01'
+NUM_PRIOR_WEEKS = 4
+NUM_POSTERIOR_WEEKS = 4
+# days left out after each posterior week (the original analysis skipped one day: 07-06, 07-14 and 07-22)
+POSTERIOR_GAP_DAYS = 0
 
-def analyze_ct(ct_data):
-    # Week 1-4
-    ct_data['daily_stats'] = ct_data['tot_cases'] + ct_data['tot_death']
-    four_week_data = ct_data[ct_data['submission_date'] > '2020-05-31']
-    four_week_data = four_week_data[four_week_data['submission_date'] < '2020-06-29']
-    beta = 1 / four_week_data['daily_stats'].mean()
-    x = np.linspace(0, 250, 250)
-    y1 = stats.gamma.pdf(x, a=1, scale=1 / beta)
-
-    # Week 5
-    fifth_week_data = ct_data[ct_data['submission_date'] > '2020-06-28']
-    fifth_week_data = fifth_week_data[fifth_week_data['submission_date'] < '2020-07-06']
-    alpha_1 = 1 + fifth_week_data['daily_stats'].sum()
-    beta_1 = beta + len(fifth_week_data)
-    y2 = stats.gamma.pdf(x, a=alpha_1, scale=1 / beta_1)
-
-    # Week 6
-    sixth_week_data = ct_data[ct_data['submission_date'] > '2020-07-06']
-    sixth_week_data = sixth_week_data[sixth_week_data['submission_date'] < '2020-07-14']
-    alpha_2 = alpha_1 + sixth_week_data['daily_stats'].sum()
-    beta_2 = beta_1 + len(sixth_week_data)
-    y3 = stats.gamma.pdf(x, a=alpha_2, scale=1 / beta_2)
-
-    # Week 7
-    seventh_week_data = ct_data[ct_data['submission_date'] > '2020-07-14']
-    seventh_week_data = seventh_week_data[seventh_week_data['submission_date'] < '2020-07-22']
-    alpha_3 = alpha_2 + seventh_week_data['daily_stats'].sum()
-    beta_3 = beta_2 + len(seventh_week_data)
-    y4 = stats.gamma.pdf(x, a=alpha_3, scale=1 / beta_3)
-
-    # Week 8
-    eightht_week_data = ct_data[ct_data['submission_date'] > '2020-07-22']
-    eightht_week_data = eightht_week_data[eightht_week_data['submission_date'] < '2020-07-30']
-    alpha_4 = alpha_3 + eightht_week_data['daily_stats'].sum()
-    beta_4 = beta_3 + len(eightht_week_data)
-    y5 = stats.gamma.pdf(x, a=alpha_4, scale=1 / beta_4)
 
-    figure(figsize=(10, 5), dpi=100)
-    plt.plot(x, y1, label='Prior - Exponiential distribution')
-    plt.plot(x, y2, label='Posterior after week-5 (Gamma distribution)')
-    plt.plot(x, y3, label='Posterior after week-6 (Gamma distribution)')
-    plt.plot(x, y4, label='Posterior after week-7 (Gamma distribution)')
-    plt.plot(x, y5, label='Posterior after week-8 (Gamma distribution)')
-    plt.xlabel('Covid Cases')
-    plt.ylabel('Pmf')
+def get_gamma_summary(alpha, beta, ci_alpha=0.05):
+    """
+    Closed-form summary of Gamma(alpha, rate=beta) distributions, for scalar or array parameters
+
+    :param alpha: shape parameter(s)
+    :param beta: rate parameter(s)
+    :param ci_alpha: 1 - probability of the credible interval
+    :return: Dict with the mean, MAP (mode) and the equal-tailed credible interval bounds
+    """
+    alpha = np.asarray(alpha, dtype=float)
+    beta = np.asarray(beta, dtype=float)
+    return {
+        'mean': alpha / beta,
+        # the mode is at 0 when alpha < 1 (e.g. for an exponential prior)
+        'map': np.maximum(alpha - 1, 0) / beta,
+        'lower': stats.gamma.ppf(ci_alpha / 2, a=alpha, scale=1 / beta),
+        'upper': stats.gamma.ppf(1 - ci_alpha / 2, a=alpha, scale=1 / beta),
+    }
+
+
+def compute_weekly_posteriors(data, value_cols, start_date=PRIOR_START_DATE, num_prior_weeks=NUM_PRIOR_WEEKS,
+                              num_weeks=NUM_POSTERIOR_WEEKS, gap_days=POSTERIOR_GAP_DAYS, ci_alpha=0.05,
+                              location_col_name='state', date_col_name='submission_date'):
+    """
+    Sequential Gamma-Poisson posteriors of the daily rate for any number of states and weeks.
+    The prior is exponential (Gamma with alpha = 1) with the mean of the first num_prior_weeks weeks, and it is
+    updated with each of the following weeks in turn: alpha += sum of the week, beta += days in the week.
+    Weekly sums and counts come from one groupby over day offsets from start_date, and the parameters of every
+    posterior are cumulative sums over the weeks.
+
+    :param data: dataframe with data of one or more states
+    :param value_cols: columns added up into the daily count (e.g. ['tot_cases', 'tot_death'])
+    :param start_date: first day of the prior weeks
+    :param num_prior_weeks: number of weeks used for the prior
+    :param num_weeks: number of weeks the posterior is updated with
+    :param gap_days: number of days left out after each of the posterior weeks
+    :param ci_alpha: 1 - probability of the credible intervals
+    :param location_col_name: location column name
+    :param date_col_name: date column name
+    :return: dataframe with one row per state x week (state, week, alpha, beta, mean, map, lower, upper), where
+             week is the number of weeks of data seen (counted from start_date) and the row for week
+             num_prior_weeks holds the prior
+    """
+    day_offsets = (pd.to_datetime(data[date_col_name]) - pd.Timestamp(start_date)).dt.days.to_numpy()
+    # posterior weeks start after the prior weeks, each followed by gap_days days that are left out
+    posterior_offsets = day_offsets - 7 * num_prior_weeks
+    weeks = np.where(posterior_offsets < 0, day_offsets // 7, num_prior_weeks + posterior_offsets // (7 + gap_days))
+    in_gap = (posterior_offsets >= 0) & (posterior_offsets % (7 + gap_days) >= 7)
+    in_range = (day_offsets >= 0) & (weeks < num_prior_weeks + num_weeks) & ~in_gap
+    weekly = pd.DataFrame({'state': data[location_col_name].to_numpy()[in_range],
+                           'week': weeks[in_range],
+                           'value': data[value_cols].sum(axis=1).to_numpy()[in_range]}) \
+        .groupby(['state', 'week'])['value'].agg(['sum', 'count'])
+    all_weeks = range(num_prior_weeks + num_weeks)
+    sums = weekly['sum'].unstack(fill_value=0).reindex(columns=all_weeks, fill_value=0)
+    counts = weekly['count'].unstack(fill_value=0).reindex(columns=all_weeks, fill_value=0)
+    states = sums.index.to_numpy()
+    sums, counts = sums.to_numpy(dtype=float), counts.to_numpy(dtype=float)
+
+    # exponential prior: beta = 1 / mean of the prior weeks
+    prior_beta = counts[:, :num_prior_weeks].sum(axis=1) / sums[:, :num_prior_weeks].sum(axis=1)
+    # the first column is the prior, followed by the posterior after each week
+    alpha = 1 + np.concatenate([np.zeros((len(states), 1)), np.cumsum(sums[:, num_prior_weeks:], axis=1)], axis=1)
+    beta = prior_beta[:, np.newaxis] + np.concatenate(
+        [np.zeros((len(states), 1)), np.cumsum(counts[:, num_prior_weeks:], axis=1)], axis=1)
+
+    posteriors = pd.DataFrame({
+        'state': np.repeat(states, num_weeks + 1),
+        'week': np.tile(np.arange(num_prior_weeks, num_prior_weeks + num_weeks + 1), len(states)),
+        'alpha': alpha.ravel(),
+        'beta': beta.ravel(),
+    })
+    return posteriors.assign(**get_gamma_summary(posteriors['alpha'], posteriors['beta'], ci_alpha))
 
-    # displaying the title
-    plt.title("Posterior distributions for Connecticut covid cases")
-    plt.legend()
-    plt.savefig('./plots/CT_stats_posterior.png')
-    y2 = y2.tolist()
-    max_index = y2.index(max(y2))
-    print("MAP for posterior after week 5:", max_index)
-
-    y3 = y3.tolist()
-    max_index = y3.index(max(y3))
-    print("MAP for posterior after week 6:", max_index)
-
-    y4 = y4.tolist()
-    max_index = y4.index(max(y4))
-    print("MAP for posterior after week 7:", max_index)
-
-    y5 = y5.tolist()
-    max_index = y5.index(max(y5))
-    print("MAP for posterior after week 8:", max_index)
-
-
-def analyze_fl(fl_data):
-    # Week 1-4
-    fl_data['daily_stats'] = fl_data['tot_cases'] + fl_data['tot_death']
-    four_week_data = fl_data[fl_data['submission_date'] > '2020-05-31']
-    four_week_data = four_week_data[four_week_data['submission_date'] < '2020-06-29']
-    beta = 1 / four_week_data['daily_stats'].mean()
-    x = np.linspace(8000, 11000, 3000)
-    y1 = stats.gamma.pdf(x, a=1, scale=1 / beta)
-
-    # Week 5
-    fifth_week_data = fl_data[fl_data['submission_date'] > '2020-06-28']
-    fifth_week_data = fifth_week_data[fifth_week_data['submission_date'] < '2020-07-06']
-    alpha_1 = 1 + fifth_week_data['daily_stats'].sum()
-    beta_1 = beta + len(fifth_week_data)
-    y2 = stats.gamma.pdf(x, a=alpha_1, scale=1 / beta_1)
-
-    # Week 6
-    sixth_week_data = fl_data[fl_data['submission_date'] > '2020-07-06']
-    sixth_week_data = sixth_week_data[sixth_week_data['submission_date'] < '2020-07-14']
-    alpha_2 = alpha_1 + sixth_week_data['daily_stats'].sum()
-    beta_2 = beta_1 + len(sixth_week_data)
-    y3 = stats.gamma.pdf(x, a=alpha_2, scale=1 / beta_2)
-
-    # Week 7
-    seventh_week_data = fl_data[fl_data['submission_date'] > '2020-07-14']
-    seventh_week_data = seventh_week_data[seventh_week_data['submission_date'] < '2020-07-22']
-    alpha_3 = alpha_2 + seventh_week_data['daily_stats'].sum()
-    beta_3 = beta_2 + len(seventh_week_data)
-    y4 = stats.gamma.pdf(x, a=alpha_3, scale=1 / beta_3)
-
-    # Week 8
-    eightht_week_data = fl_data[fl_data['submission_date'] > '2020-07-22']
-    eightht_week_data = eightht_week_data[eightht_week_data['submission_date'] < '2020-07-30']
-    alpha_4 = alpha_3 + eightht_week_data['daily_stats'].sum()
-    beta_4 = beta_3 + len(eightht_week_data)
-    y5 = stats.gamma.pdf(x, a=alpha_4, scale=1 / beta_4)
 
+def get_posterior_grid(alpha, beta, num_sd=6, num_points=300):
+    """
+    Points covering Gamma(alpha, rate=beta) distributions: num_points evenly spaced points over mode +- num_sd
+    standard deviations (cut at 0), so the grid follows the distribution at any scale
+
+    :param alpha: shape parameter(s)
+    :param beta: rate parameter(s)
+    :param num_sd: half width of the grid in standard deviations
+    :param num_points: number of points in each grid
+    :return: array of shape (..., num_points) with one grid per distribution
+    """
+    alpha = np.asarray(alpha, dtype=float)[..., np.newaxis]
+    beta = np.asarray(beta, dtype=float)[..., np.newaxis]
+    mode = np.maximum(alpha - 1, 0) / beta
+    sd = np.sqrt(alpha) / beta
+    start = np.maximum(mode - num_sd * sd, 0)
+    end = mode + num_sd * sd
+    return start + (end - start) * np.linspace(0, 1, num_points)
+
+
+def evaluate_posterior(alpha, beta, num_sd=6, num_points=300):
+    """
+    Log densities of Gamma(alpha, rate=beta) distributions on their adaptive grids.
+    Densities are kept in log space, so they do not underflow for large alpha (e.g. hundreds of thousands of cases).
+
+    :param alpha: shape parameter(s)
+    :param beta: rate parameter(s)
+    :return: (grid points, log densities), both of shape (..., num_points)
+    """
+    x = get_posterior_grid(alpha, beta, num_sd=num_sd, num_points=num_points)
+    alpha = np.asarray(alpha, dtype=float)[..., np.newaxis]
+    beta = np.asarray(beta, dtype=float)[..., np.newaxis]
+    return x, stats.gamma.logpdf(x, a=alpha, scale=1 / beta)
+
+
+def plot_posteriors(posteriors, title, path, num_prior_weeks=NUM_PRIOR_WEEKS):
+    """
+    :param posteriors: rows of compute_weekly_posteriors for one state
+    """
+    x, log_density = evaluate_posterior(posteriors['alpha'].to_numpy(), posteriors['beta'].to_numpy())
     figure(figsize=(10, 5), dpi=100)
-    plt.plot(x, y1, label='Prior - Exponiential distribution')
-    plt.plot(x, y2, label='Posterior after week-5 (Gamma distribution)')
-    plt.plot(x, y3, label='Posterior after week-6 (Gamma distribution)')
-    plt.plot(x, y4, label='Posterior after week-7 (Gamma distribution)')
-    plt.plot(x, y5, label='Posterior after week-8 (Gamma distribution)')
+    for i, row in enumerate(posteriors.itertuples()):
+        if row.week == num_prior_weeks:
+            label = 'Prior - Exponiential distribution'
+        else:
+            label = 'Posterior after week-{} (Gamma distribution)'.format(row.week)
+        plt.plot(x[i], np.exp(log_density[i]), label=label)
     plt.xlabel('Covid Cases')
     plt.ylabel('Pmf')
 
     # displaying the title
-    plt.title("Posterior distributions for Florida covid cases")
+    plt.title(title)
     plt.legend()
-    plt.savefig('./plots/FL_stats_posterior.png')
-    y2 = y2.tolist()
-    max_index = y2.index(max(y2))
-    print("MAP for posterior after week 5:", max_index + 8000)
-
-    y3 = y3.tolist()
-    max_index = y3.index(max(y3))
-    print("MAP for posterior after week 6:", max_index + 8000)
-
-    y4 = y4.tolist()
-    max_index = y4.index(max(y4))
-    print("MAP for posterior after week 7:", max_index + 8000)
-
-    y5 = y5.tolist()
-    max_index = y5.index(max(y5))
-    print("MAP for posterior after week 8:", max_index + 8000)
\ No newline at end of file
+    plt.savefig(path)
+
+
+def analyze_state(data, state_name, plot_path, reporter=print):
+    """
+    Posterior distributions of the daily cases + deaths rate of one state after each of the weeks 5 to 8
+
+    :param reporter: function called with each line of the report, None to skip the report
+    :return: List[PosteriorResult], one per week
+    """
+    posteriors = compute_weekly_posteriors(data, ['tot_cases', 'tot_death'])
+    plot_posteriors(posteriors, "Posterior distributions for {} covid cases".format(state_name), plot_path)
+
+    results = []
+    for row in posteriors[posteriors['week'] > NUM_PRIOR_WEEKS].itertuples():
+        results.append(PosteriorResult(row.week, row.alpha, row.beta, row.map, row.mean, row.lower, row.upper))
+        if reporter is not None:
+            reporter("MAP for posterior after week {}: {}, 95% credible interval: [{}, {}]".format(
+                row.week, row.map, row.lower, row.upper))
+    return results
+
+
+def analyze_ct(ct_data, reporter=print):
+    """
+    Posterior distributions of the daily cases + deaths rate after each of the weeks 5 to 8
+
+    :param reporter: function called with each line of the report, None to skip the report
+    :return: List[PosteriorResult], one per week
+    """
+    return analyze_state(ct_data, 'Connecticut', './plots/CT_stats_posterior.png', reporter=reporter)
+
+
+def analyze_fl(fl_data, reporter=print):
+    """
+    Posterior distributions of the daily cases + deaths rate after each of the weeks 5 to 8
+
+    :param reporter: function called with each line of the report, None to skip the report
+    :return: List[PosteriorResult], one per week
+    """
+    return analyze_state(fl_data, 'Florida', './plots/FL_stats_posterior.png', reporter=reporter)
+
+
+class OnlinePosterior:
+    """
+    Gamma posterior of a daily Poisson rate that is updated one day at a time, for monitoring a state as new
+    counts are published. Each update is O(1) and only (alpha, beta) are kept, so the state can be checkpointed
+    to a small json file.
+    With a discount factor below 1, the evidence of older days is down-weighted at every update
+    (alpha = discount * alpha + count, beta = discount * beta + 1), so the estimate follows changes in the rate
+    using roughly the last 1 / (1 - discount) days.
+    """
+
+    def __init__(self, alpha=1.0, beta=1.0, discount=1.0, last_date=None, num_updates=0):
+        """
+        :param alpha: shape parameter of the prior (or current posterior)
+        :param beta: rate parameter of the prior (or current posterior)
+        :param discount: weight kept by the existing evidence at every update, in (0, 1]
+        :param last_date: date of the last count added
+        :param num_updates: number of counts added
+        """
+        if not 0 < discount <= 1:
+            raise ValueError("discount should be in (0, 1], got {}".format(discount))
+        self.alpha = float(alpha)
+        self.beta = float(beta)
+        self.discount = float(discount)
+        self.last_date = None if last_date is None else pd.Timestamp(last_date)
+        self.num_updates = num_updates
+
+    @classmethod
+    def from_prior_data(cls, values, discount=1.0):
+        """
+        Exponential prior with the mean of the given daily counts, as used by compute_weekly_posteriors
+
+        :param values: daily counts for the prior
+        :param discount: weight kept by the existing evidence at every update, in (0, 1]
+        :return: OnlinePosterior
+        """
+        return cls(alpha=1.0, beta=1 / np.nanmean(np.asarray(values, dtype=float)), discount=discount)
+
+    def update(self, count, date=None):
+        """
+        Add the count of a day. Counts for dates up to the last date already added are skipped, so replaying a
+        file of daily counts is safe.
+
+        :param count: count of the day
+        :param date: date of the count (optional)
+        :return: True if the count was added
+        """
+        if date is not None:
+            date = pd.Timestamp(date)
+            if self.last_date is not None and date <= self.last_date:
+                return False
+            self.last_date = date
+        self.alpha = self.discount * self.alpha + count
+        self.beta = self.discount * self.beta + 1
+        self.num_updates += 1
+        return True
+
+    def update_many(self, counts, dates=None):
+        """
+        :param counts: counts of consecutive days, in order
+        :param dates: dates of the counts (optional)
+        :return: number of counts added
+        """
+        if dates is None:
+            dates = [None] * len(counts)
+        return sum(self.update(count, date) for count, date in zip(counts, dates))
+
+    def summary(self, ci_alpha=0.05):
+        """
+        :param ci_alpha: 1 - probability of the credible interval
+        :return: Dict with the mean, MAP and credible interval bounds of the current posterior
+        """
+        return {key: float(value) for key, value in get_gamma_summary(self.alpha, self.beta, ci_alpha).items()}
+
+    def map_estimate(self):
+        """
+        :return: MAP of the current posterior
+        """
+        return self.summary()['map']
+
+    def credible_interval(self, ci_alpha=0.05):
+        """
+        :param ci_alpha: 1 - probability of the credible interval
+        :return: (lower, upper) bounds of the equal-tailed credible interval of the current posterior
+        """
+        summary = self.summary(ci_alpha)
+        return summary['lower'], summary['upper']
+
+    def save(self, path):
+        """
+        Write the state to a json checkpoint file
+
+        :param path: checkpoint file
+        """
+        state = {
+            'alpha': self.alpha,
+            'beta': self.beta,
+            'discount': self.discount,
+            'last_date': None if self.last_date is None else self.last_date.strftime('%Y-%m-%d'),
+            'num_updates': self.num_updates,
+        }
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # atomic write, as in preprocessing.write_cached_data
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: checkpoint file written by save
+        :return: OnlinePosterior
+        """
+        with open(path) as f:
+            return cls(**json.load(f))
@@ -0,0 +1,80 @@
+import numpy as np
+from parallel import get_batch_sizes, get_seed_sequence, map_tasks
+from results import BootstrapInterval
+
+
+def compute_bootstrap_batch(task):
+    """
+    Replicate means for a batch of bootstrap resamples.
+    The resample indices of each sample are drawn as one (replicates x n) integer matrix and all the replicate
+    means come from one reduction over it.
+
+    :param task: (list of samples, number of replicates, seed)
+    :return: array of shape (replicates, samples) with the replicate means
+    """
+    samples, num_replicates, seed = task
+    rng = np.random.default_rng(seed)
+    replicate_means = np.empty((num_replicates, len(samples)))
+    for i, sample in enumerate(samples):
+        indices = rng.integers(0, len(sample), size=(num_replicates, len(sample)))
+        replicate_means[:, i] = sample[indices].mean(axis=1)
+    return replicate_means
+
+
+def compute_bootstrap_means(samples, num_replicates=10000, batch_size=10000, seed=None, num_workers=1):
+    """
+    Bootstrap replicate means of one or more samples, each resampled independently.
+    Batches get independent random streams spawned from the seed, so the replicates only depend on the seed and
+    batch size, not on the number of workers.
+
+    :param samples: list of samples (arrays or series, nan values are skipped)
+    :param num_replicates: number of bootstrap replicates
+    :param batch_size: number of replicates drawn together
+    :param seed: seed for the resampling (None for fresh entropy)
+    :param num_workers: number of worker processes the batches are spread over
+    :return: array of shape (replicates, samples) with the replicate means
+    """
+    samples = [np.asarray(sample, dtype=float) for sample in samples]
+    samples = [sample[~np.isnan(sample)] for sample in samples]
+    batch_sizes = get_batch_sizes(num_replicates, batch_size)
+    seeds = get_seed_sequence(seed).spawn(len(batch_sizes))
+    tasks = [(samples, size, batch_seed) for size, batch_seed in zip(batch_sizes, seeds)]
+    return np.concatenate(map_tasks(compute_bootstrap_batch, tasks, num_workers))
+
+
+def get_percentile_interval(estimate, replicates, alpha=0.05):
+    """
+    :param estimate: estimate on the original data
+    :param replicates: bootstrap replicates of the estimate
+    :param alpha: 1 - confidence level
+    :return: BootstrapInterval
+    """
+    lower, upper = np.quantile(replicates, [alpha / 2, 1 - alpha / 2])
+    return BootstrapInterval(float(estimate), float(lower), float(upper), alpha)
+
+
+def bootstrap_mean_ci(data, alpha=0.05, num_replicates=10000, seed=None, num_workers=1):
+    """
+    Bootstrap (percentile) confidence interval for the mean
+
+    :param data: sample values
+    :param alpha: 1 - confidence level
+    :return: BootstrapInterval
+    """
+    replicate_means = compute_bootstrap_means([data], num_replicates, seed=seed, num_workers=num_workers)
+    return get_percentile_interval(np.nanmean(np.asarray(data, dtype=float)), replicate_means[:, 0], alpha)
+
+
+def bootstrap_mean_difference_ci(data1, data2, alpha=0.05, num_replicates=10000, seed=None, num_workers=1):
+    """
+    Bootstrap (percentile) confidence interval for the difference of means (data2 - data1) of two independent
+    samples
+
+    :param data1: values of the first sample
+    :param data2: values of the second sample
+    :param alpha: 1 - confidence level
+    :return: BootstrapInterval
+    """
+    replicate_means = compute_bootstrap_means([data1, data2], num_replicates, seed=seed, num_workers=num_workers)
+    estimate = np.nanmean(np.asarray(data2, dtype=float)) - np.nanmean(np.asarray(data1, dtype=float))
+    return get_percentile_interval(estimate, replicate_means[:, 1] - replicate_means[:, 0], alpha)
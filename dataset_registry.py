@@ -0,0 +1,82 @@
+from typing import Dict, List, Tuple
+import pandas as pd
+from preprocessing import read_processed_data
+
+# cleaned datasets written by the driver, keyed by (state, kind)
+PROCESSED_DATA_PATHS = {
+    ('CT', 'cases'): './processed/clean_ct_cases.csv',
+    ('FL', 'cases'): './processed/clean_fl_cases.csv',
+    ('CT', 'vax'): './processed/clean_ct_vax.csv',
+    ('FL', 'vax'): './processed/clean_fl_vax.csv',
+}
+
+DATE_COL_NAMES = {
+    'cases': 'submission_date',
+    'vax': 'Date',
+}
+
+
+class DatasetRegistry:
+    """
+    In-memory store of the cleaned datasets shared by all the analysis stages.
+    The driver builds it once, so the stages do not have to re-read (and re-parse) the processed csv files.
+    """
+
+    def __init__(self):
+        self._datasets = {}
+
+    def add(self, state: str, kind: str, data):
+        """
+        :param state: state of the data (e.g. 'CT')
+        :param kind: kind of data ('cases' or 'vax')
+        :param data: cleaned dataframe
+        """
+        self._datasets[(state, kind)] = data
+
+    def get(self, state: str, kind: str):
+        """
+        :param state: state of the data (e.g. 'CT')
+        :param kind: kind of data ('cases' or 'vax')
+        :return: cleaned dataframe
+        """
+        return self._datasets[(state, kind)]
+
+    def states(self, kind: str):
+        """
+        :param kind: kind of data ('cases' or 'vax')
+        :return: List of states which have data of the given kind
+        """
+        return [state for state, data_kind in self._datasets if data_kind == kind]
+
+    def concat(self, kind: str):
+        """
+        :param kind: kind of data ('cases' or 'vax')
+        :return: dataframe with the data of every state for the given kind
+        """
+        return pd.concat([self._datasets[(state, kind)] for state in self.states(kind)])
+
+    def export_csv(self, paths: Dict[Tuple[str, str], str] = PROCESSED_DATA_PATHS):
+        """
+        Write the registered datasets to csv files
+
+        :param paths: csv path for each (state, kind)
+        """
+        for key, path in paths.items():
+            if key in self._datasets:
+                self._datasets[key].to_csv(path)
+
+    @classmethod
+    def from_processed_csv(cls, paths: Dict[Tuple[str, str], str] = PROCESSED_DATA_PATHS, kinds: List[str] = None):
+        """
+        Build the registry from the csv files written by a previous driver run
+
+        :param paths: csv path for each (state, kind)
+        :param kinds: kinds of data to load (None loads all of them)
+        :return: DatasetRegistry
+        """
+        registry = cls()
+        for (state, kind), path in paths.items():
+            if kinds is not None and kind not in kinds:
+                continue
+            registry.add(state, kind, read_processed_data(path, DATE_COL_NAMES[kind]))
+        return registry
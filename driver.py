@@ -1,88 +1,157 @@
-from preprocessing import get_state_data, get_daily_cases_data, remove_outliers
+import argparse
+import os
+import pandas as pd
+from preprocessing import get_clean_state_data, get_state_data, get_date_range
+from incremental_update import update_clean_state_data
+from dataset_registry import DatasetRegistry, PROCESSED_DATA_PATHS
 from two_ks_test import two_sample_KS_test
 from permutation_test import permutation_test
 from one_ks_test import one_sample_KS_test
+from pairwise_tests import get_quarter_windows, run_pairwise_tests
+from forecasting import run_nightly_forecasts
 from hypothesis_test_2a import run_hyp_tests
 from bayesian import analyze_ct, analyze_fl
 from ar_ewma_pairedTtest import part_e_d
 
 # States allocates: Connecticut (CT) and Florida (FL)
 
+# number of rows parsed at a time while reading the raw CDC files
+CSV_CHUNK_SIZE = 100000
+# dtypes of the columns read from the raw CDC files: counts are parsed as nullable 32-bit integers, which are
+# exact for every count in the data (float32 is not above 2^24 doses) and keep the missing values
+CASES_DTYPES = {'submission_date': str, 'tot_cases': 'Int32', 'tot_death': 'Int32', 'new_case': 'Int32',
+                'new_death': 'Int32'}
+VAX_DTYPES = {'Date': str, 'Administered': 'Int32'}
+
 
 def process_cases_data():
     covid_cases_data_path = './dataset/United_States_COVID-19_Cases_and_Deaths_by_State_over_Time.csv'
 
-    ct_state_cases_data, fl_state_cases_data = get_state_data(filename=covid_cases_data_path,
-                                                              states=['CT', 'FL'],
-                                                              location_col_name='state',
-                                                              cols=['submission_date', 'state',
-                                                                    'tot_cases', 'tot_death',
-                                                                    'new_case', 'new_death'])
-
-    ct_daily_cases_data = get_daily_cases_data(ct_state_cases_data,
-                                               location_col_name='state',
-                                               date_col_name='submission_date',
-                                               non_cumulative_cols=['new_case', 'new_death'],
-                                               set_zero_for_negatives=True)
-    fl_daily_cases_data = get_daily_cases_data(fl_state_cases_data,
-                                               location_col_name='state',
-                                               date_col_name='submission_date',
-                                               non_cumulative_cols=['new_case', 'new_death'],
-                                               set_zero_for_negatives=True)
-
-    ct_daily_cleaned_data = remove_outliers(ct_daily_cases_data)
-    fl_daily_cleaned_data = remove_outliers(fl_daily_cases_data)
+    ct_daily_cleaned_data, fl_daily_cleaned_data = get_clean_state_data(filename=covid_cases_data_path,
+                                                                        states=['CT', 'FL'],
+                                                                        location_col_name='state',
+                                                                        date_col_name='submission_date',
+                                                                        cols=['submission_date', 'state',
+                                                                              'tot_cases', 'tot_death',
+                                                                              'new_case', 'new_death'],
+                                                                        non_cumulative_cols=['new_case', 'new_death'],
+                                                                        set_zero_for_negatives=True,
+                                                                        cols_to_consider=['tot_cases', 'tot_death'],
+                                                                        chunksize=CSV_CHUNK_SIZE,
+                                                                        dtypes=CASES_DTYPES)
     return ct_daily_cleaned_data, fl_daily_cleaned_data
 
 
 def process_vax_data():
     covid_vax_data_path = './dataset/COVID-19_Vaccinations_in_the_United_States_Jurisdiction.csv'
 
-    ct_state_vax_data, fl_state_vax_data = get_state_data(filename=covid_vax_data_path,
-                                                          states=['CT', 'FL'],
-                                                          location_col_name='Location',
-                                                          cols=['Date', 'Location',
-                                                                'Administered'])
-
-    ct_daily_vax_data = get_daily_cases_data(ct_state_vax_data,
-                                             location_col_name='Location',
-                                             date_col_name='Date',
-                                             non_cumulative_cols=[],
-                                             set_zero_for_negatives=True)
-    fl_daily_vax_data = get_daily_cases_data(fl_state_vax_data,
-                                             location_col_name='Location',
-                                             date_col_name='Date',
-                                             non_cumulative_cols=[],
-                                             set_zero_for_negatives=True)
-
-    ct_daily_cleaned_vax_data = remove_outliers(ct_daily_vax_data,
-                                                cols_to_consider=['Administered'])
-    fl_daily_cleaned_vax_data = remove_outliers(fl_daily_vax_data,
-                                                cols_to_consider=['Administered'])
+    ct_daily_cleaned_vax_data, fl_daily_cleaned_vax_data = get_clean_state_data(filename=covid_vax_data_path,
+                                                                                states=['CT', 'FL'],
+                                                                                location_col_name='Location',
+                                                                                date_col_name='Date',
+                                                                                cols=['Date', 'Location',
+                                                                                      'Administered'],
+                                                                                non_cumulative_cols=[],
+                                                                                set_zero_for_negatives=True,
+                                                                                cols_to_consider=['Administered'],
+                                                                                chunksize=CSV_CHUNK_SIZE,
+                                                                                dtypes=VAX_DTYPES)
+    return ct_daily_cleaned_vax_data, fl_daily_cleaned_vax_data
+
+
+def update_cases_data(new_cases_data_path, export_csv=True):
+    new_cases_data = get_state_data(filename=new_cases_data_path,
+                                    states=['CT', 'FL'],
+                                    location_col_name='state',
+                                    cols=['submission_date', 'state',
+                                          'tot_cases', 'tot_death',
+                                          'new_case', 'new_death'],
+                                    chunksize=CSV_CHUNK_SIZE,
+                                    dtypes=CASES_DTYPES)
+    csv_paths = {'CT': PROCESSED_DATA_PATHS[('CT', 'cases')], 'FL': PROCESSED_DATA_PATHS[('FL', 'cases')]}
+    clean_data = update_clean_state_data(pd.concat(new_cases_data),
+                                         store_name='cases',
+                                         location_col_name='state',
+                                         date_col_name='submission_date',
+                                         non_cumulative_cols=['new_case', 'new_death'],
+                                         set_zero_for_negatives=True,
+                                         cols_to_consider=['tot_cases', 'tot_death'],
+                                         csv_paths=csv_paths if export_csv else None)
+    ct_daily_cleaned_data = clean_data[clean_data['state'] == 'CT'].sort_index()
+    fl_daily_cleaned_data = clean_data[clean_data['state'] == 'FL'].sort_index()
+    return ct_daily_cleaned_data, fl_daily_cleaned_data
+
+
+def update_vax_data(new_vax_data_path, export_csv=True):
+    new_vax_data = get_state_data(filename=new_vax_data_path,
+                                  states=['CT', 'FL'],
+                                  location_col_name='Location',
+                                  cols=['Date', 'Location',
+                                        'Administered'],
+                                  chunksize=CSV_CHUNK_SIZE,
+                                  dtypes=VAX_DTYPES)
+    csv_paths = {'CT': PROCESSED_DATA_PATHS[('CT', 'vax')], 'FL': PROCESSED_DATA_PATHS[('FL', 'vax')]}
+    clean_data = update_clean_state_data(pd.concat(new_vax_data),
+                                         store_name='vax',
+                                         location_col_name='Location',
+                                         date_col_name='Date',
+                                         non_cumulative_cols=[],
+                                         set_zero_for_negatives=True,
+                                         cols_to_consider=['Administered'],
+                                         csv_paths=csv_paths if export_csv else None)
+    ct_daily_cleaned_vax_data = clean_data[clean_data['Location'] == 'CT'].sort_index()
+    fl_daily_cleaned_vax_data = clean_data[clean_data['Location'] == 'FL'].sort_index()
     return ct_daily_cleaned_vax_data, fl_daily_cleaned_vax_data
 
 
 def get_data_for_date_range(data, start_date, end_date, date_col_name):
-    return data[(data[date_col_name] >= start_date) & (data[date_col_name] <= end_date)].reset_index(drop=True)
+    return get_date_range(data, start_date, end_date, date_col_name)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--skip-csv-export', action='store_true',
+                        help='do not write the cleaned datasets to processed/')
+    parser.add_argument('--cases-update', metavar='CSV',
+                        help='incrementally update the cleaned cases data with the new rows in CSV')
+    parser.add_argument('--vax-update', metavar='CSV',
+                        help='incrementally update the cleaned vaccination data with the new rows in CSV')
+    parser.add_argument('--pairwise-output', metavar='DIR',
+                        help='write the KS / permutation test matrices for every pair of states to DIR')
+    parser.add_argument('--forecast-output', metavar='DIR',
+                        help='write AR / EWMA forecasts for every state in the cleaned data to DIR')
+    args = parser.parse_args()
+
+    registry = DatasetRegistry()
+
     print("-----------Part 1--------------")
     print("-----------Data cleaning for cases and death statistics--------------")
     # Mandatory Task 1: To clean the given dataset for cases
-    ct_daily_cleaned_data, fl_daily_cleaned_data = process_cases_data()
-
-    ct_daily_cleaned_data.to_csv('./processed/clean_ct_cases.csv')
-    fl_daily_cleaned_data.to_csv('./processed/clean_fl_cases.csv')
+    if args.cases_update is None:
+        ct_daily_cleaned_data, fl_daily_cleaned_data = process_cases_data()
+    else:
+        ct_daily_cleaned_data, fl_daily_cleaned_data = update_cases_data(args.cases_update,
+                                                                         export_csv=not args.skip_csv_export)
+    registry.add('CT', 'cases', ct_daily_cleaned_data)
+    registry.add('FL', 'cases', fl_daily_cleaned_data)
 
     print("-----------Data cleaning for vaccination statistics--------------")
-    ct_daily_cleaned_vax_data, fl_daily_cleaned_vax_data = process_vax_data()
-
-    ct_daily_cleaned_vax_data.to_csv('./processed/clean_ct_vax.csv')
-    fl_daily_cleaned_vax_data.to_csv('./processed/clean_fl_vax.csv')
+    if args.vax_update is None:
+        ct_daily_cleaned_vax_data, fl_daily_cleaned_vax_data = process_vax_data()
+    else:
+        ct_daily_cleaned_vax_data, fl_daily_cleaned_vax_data = update_vax_data(args.vax_update,
+                                                                               export_csv=not args.skip_csv_export)
+    registry.add('CT', 'vax', ct_daily_cleaned_vax_data)
+    registry.add('FL', 'vax', fl_daily_cleaned_vax_data)
+
+    if not args.skip_csv_export:
+        # incremental updates already updated their csv files in place
+        updated_kinds = [kind for kind, update_path in [('cases', args.cases_update), ('vax', args.vax_update)]
+                         if update_path is not None]
+        registry.export_csv({key: path for key, path in PROCESSED_DATA_PATHS.items() if key[1] not in updated_kinds})
 
     print("\n\n-----------Part 2a--------------")
-    run_hyp_tests()
+    run_hyp_tests(registry)
 
     print("\n\n-----------Part 2b--------------")
     # Mandatory Task 2b: To infer equality of distributions
@@ -109,6 +178,15 @@ if __name__ == "__main__":
     print("\n----------- Deaths --------------")
     one_sample_KS_test(ct_last_quarter_cases, fl_last_quarter_cases, 'tot_death')
 
+    if args.pairwise_output is not None:
+        print("\n\n----------- Pairwise tests for all states--------------")
+        all_states_cases = registry.concat('cases')
+        quarters = get_quarter_windows('2020-04-01', 8)
+        for col_name in ['tot_cases', 'tot_death']:
+            output_path = os.path.join(args.pairwise_output, 'pairwise_{}.npz'.format(col_name))
+            run_pairwise_tests(all_states_cases, col_name, quarters, output_path=output_path)
+            print("Saved pairwise test matrices for col: {} to {}".format(col_name, output_path))
+
     print("\n\n-----------Part 2c--------------")
     # Mandatory Task 2c: Bayesian inference
     print("\n----------- Connecticut stats --------------")
@@ -117,5 +195,14 @@ if __name__ == "__main__":
     analyze_fl(fl_daily_cleaned_data)
 
     print("\n\n-----------Part 2d and 2e--------------")
-    part_e_d()
+    part_e_d(registry)
+
+    if args.forecast_output is not None:
+        print("\n\n----------- Forecasts for all states--------------")
+        cases_forecast_path = run_nightly_forecasts(registry.concat('cases'), ['new_case', 'new_death'],
+                                                    args.forecast_output, 'cases')
+        print("Saved cases forecasts to {}".format(cases_forecast_path))
+        vax_forecast_path = run_nightly_forecasts(registry.concat('vax'), ['Administered'], args.forecast_output,
+                                                  'vax', location_col_name='Location', date_col_name='Date')
+        print("Saved vaccination forecasts to {}".format(vax_forecast_path))
 
@@ -0,0 +1,127 @@
+import numpy as np
+
+
+class ECDF:
+    """
+    Empirical CDF of a sample, stored as the sorted distinct values with the (integer) number of sample values
+    less than or equal to each of them. Queries are binary searches, so they are O(log n) per point, and values
+    are exact count / n fractions.
+    """
+
+    def __init__(self, values=None, cumulative_counts=None):
+        """
+        :param values: sorted distinct values
+        :param cumulative_counts: number of sample values <= each value
+        """
+        self.values = np.asarray([] if values is None else values, dtype=float)
+        self.cumulative_counts = np.asarray([] if cumulative_counts is None else cumulative_counts, dtype=np.int64)
+
+    @classmethod
+    def from_data(cls, data):
+        """
+        :param data: sample values (nan values are skipped)
+        :return: ECDF
+        """
+        data = np.asarray(data, dtype=float)
+        values, counts = np.unique(data[~np.isnan(data)], return_counts=True)
+        return cls(values, np.cumsum(counts))
+
+    @property
+    def n(self):
+        """
+        :return: size of the sample
+        """
+        return int(self.cumulative_counts[-1]) if len(self.cumulative_counts) else 0
+
+    def __len__(self):
+        return self.n
+
+    def _check_not_empty(self):
+        # the eCDF of an empty sample is undefined (count / 0)
+        if self.n == 0:
+            raise ValueError("ECDF of an empty sample (no non-nan values)")
+
+    def _count_at(self, positions):
+        # number of sample values before the given positions in the distinct values
+        return np.concatenate([[0], self.cumulative_counts])[positions]
+
+    def count(self, x):
+        """
+        :param x: point or array of points
+        :return: number of sample values <= x
+        """
+        return self._count_at(np.searchsorted(self.values, x, side='right'))
+
+    def count_left(self, x):
+        """
+        :param x: point or array of points
+        :return: number of sample values < x
+        """
+        return self._count_at(np.searchsorted(self.values, x, side='left'))
+
+    def cdf(self, x):
+        """
+        :param x: point or array of points
+        :return: fraction of the sample <= x
+        """
+        self._check_not_empty()
+        cdf = self.count(x) / self.n
+        return float(cdf) if np.ndim(x) == 0 else cdf
+
+    def cdf_left(self, x):
+        """
+        :param x: point or array of points
+        :return: fraction of the sample < x (limit of the eCDF from the left)
+        """
+        self._check_not_empty()
+        cdf = self.count_left(x) / self.n
+        return float(cdf) if np.ndim(x) == 0 else cdf
+
+    def ks_limits(self, x):
+        """
+        eCDF to the left of and at (right limit) each x, with the conventions of the KS tests in this project:
+        the k-th sorted sample value (0-based) has eCDF k/n, tied values take the eCDF of their last occurrence,
+        and points outside of the sample get 0 (left of it) or 1 (right of it).
+
+        :param x: array of points
+        :return: (left eCDF values, right eCDF values)
+        """
+        self._check_not_empty()
+        x = np.asarray(x, dtype=float)
+        n = self.n
+        positions = np.searchsorted(self.values, x, side='left')
+        num_smaller = self._count_at(positions)
+
+        # ecdf for point that is just before x: last value smaller than x
+        ecdf_left = np.where(num_smaller > 0, (num_smaller - 1) / n, 0.0)
+        # ecdf for point that is just after x: last occurrence of the first value greater or equal to x
+        ecdf_right = (self.cumulative_counts[np.minimum(positions, len(self.values) - 1)] - 1) / n
+
+        # points to the left / right of the entire distribution
+        outside_left = x < self.values[0]
+        outside_right = x > self.values[-1]
+        ecdf_left[outside_left], ecdf_right[outside_left] = 0, 0
+        ecdf_left[outside_right], ecdf_right[outside_right] = 1, 1
+        return ecdf_left, ecdf_right
+
+    def insert(self, data):
+        """
+        Add new sample values (e.g. the latest days of data), without sorting the existing values again
+
+        :param data: new sample values (nan values are skipped)
+        """
+        data = np.asarray(data, dtype=float)
+        new_values, new_counts = np.unique(data[~np.isnan(data)], return_counts=True)
+        if len(new_values) == 0:
+            return
+
+        counts = np.diff(self.cumulative_counts, prepend=0)
+        positions = np.searchsorted(self.values, new_values)
+        existing = positions < len(self.values)
+        existing[existing] = self.values[positions[existing]] == new_values[existing]
+
+        # values already in the sample only increase their count, the others are inserted in place
+        counts[positions[existing]] += new_counts[existing]
+        self.values = np.insert(self.values, positions[~existing], new_values[~existing])
+        counts = np.insert(counts, positions[~existing], new_counts[~existing])
+        self.cumulative_counts = np.cumsum(counts)
@@ -0,0 +1,61 @@
+import numpy as np
+from scipy.signal import lfilter
+from metrics import mse
+
+# default grid of smoothing factors for sweep_ewma_alpha
+EWMA_ALPHA_GRID = np.linspace(0.01, 1, 100)
+
+
+def ewma_predictions(values, alpha):
+    """
+    One step ahead EWMA predictions: Y_pred[0] = x[0] and Y_pred[i] = alpha * x[i-1] + (1 - alpha) * Y_pred[i-1].
+    A scalar alpha runs as a linear filter (lfilter). An array of alphas runs one recursion over time on a
+    preallocated output, vectorized across all the alphas and series.
+
+    :param values: array of shape (n,) or (series, n), in time order along the last axis
+    :param alpha: smoothing factor, or 1-D array of smoothing factors
+    :return: predictions of shape values.shape for a scalar alpha, or (alphas,) + values.shape for an array
+    """
+    values = np.asarray(values, dtype=float)
+    if np.ndim(alpha) == 0:
+        # Y_pred[i+1] = alpha * x[i] + (1 - alpha) * Y_pred[i], starting from Y_pred[0] = x[0]
+        predictions = np.empty_like(values)
+        predictions[..., 0] = values[..., 0]
+        initial_state = (1 - alpha) * values[..., :1]
+        predictions[..., 1:], _ = lfilter([alpha], [1, -(1 - alpha)], values[..., :-1], axis=-1, zi=initial_state)
+        return predictions
+
+    alphas = np.asarray(alpha, dtype=float).reshape((-1,) + (1,) * (values.ndim - 1))
+    predictions = np.empty((len(alphas),) + values.shape)
+    predictions[..., 0] = values[..., 0]
+    for i in range(1, values.shape[-1]):
+        predictions[..., i] = alphas * values[..., i - 1] + (1 - alphas) * predictions[..., i - 1]
+    return predictions
+
+
+def ewma_holdout(values, alpha, holdout=7):
+    """
+    :param values: 1-D array of values, in time order
+    :param alpha: smoothing factor
+    :param holdout: number of values at the end to return the predictions for
+    :return: (predictions, actual values) of the last holdout values
+    """
+    values = np.asarray(values, dtype=float)
+    return ewma_predictions(values, alpha)[-holdout:], values[-holdout:]
+
+
+def sweep_ewma_alpha(values, alphas=EWMA_ALPHA_GRID, holdout=None):
+    """
+    MSE of the EWMA predictions for a grid of alphas, computed in one pass over the data
+
+    :param values: array of shape (n,) or (series, n), in time order along the last axis
+    :param alphas: 1-D array of smoothing factors
+    :param holdout: number of values at the end the MSE is computed on, None for every value after the first
+    :return: (MSE of shape (alphas,) + series shape, MSE-optimal alpha for each series)
+    """
+    values = np.asarray(values, dtype=float)
+    alphas = np.asarray(alphas, dtype=float)
+    predictions = ewma_predictions(values, alphas)
+    start = 1 if holdout is None else values.shape[-1] - holdout
+    scores = mse(values[..., start:], predictions[..., start:])
+    return scores, alphas[np.argmin(scores, axis=0)]
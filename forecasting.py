@@ -0,0 +1,208 @@
+import os
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from ewma import ewma_predictions
+from metrics import mape, mse
+from results import ForecastResult
+
+# models fitted by default, as in part 2d/2e
+AR_ORDERS = [3, 5]
+EWMA_ALPHAS = [0.5, 0.8]
+
+
+def get_panel(data, columns, location_col_name='state', date_col_name='submission_date', fill_gaps=True):
+    """
+    Panel of series (state x column) aligned on the dates of the data
+
+    :param data: dataframe with data of one or more states
+    :param columns: columns of interest
+    :param location_col_name: location column name
+    :param date_col_name: date column name
+    :param fill_gaps: flag to linearly interpolate the days missing inside a series (e.g. removed outliers)
+    :return: (series labels of shape (series, 2) as (state, column), dates, values of shape (series, dates));
+             other dates missing for a state are nan
+    """
+    panel = data.pivot_table(index=date_col_name, columns=location_col_name, values=columns, dropna=False) \
+        .sort_index()
+    # one row per series, one column per date
+    panel = panel.T.reindex(pd.MultiIndex.from_product([columns, panel.columns.levels[1]])).swaplevel().sort_index()
+    if fill_gaps:
+        panel = panel.interpolate(axis=1, limit_area='inside')
+    return np.array(panel.index.tolist(), dtype=str), panel.columns.to_numpy(), panel.to_numpy(dtype=float)
+
+
+def fit_ar_batch(values, p):
+    """
+    Least squares fit of an AR(p) model with intercept for every series at once, with a batched pseudo-inverse
+    of the stacked lag matrices
+
+    :param values: array of shape (series, n), in time order along the last axis
+    :param p: number of lags
+    :return: coefficients of shape (series, p + 1) as [intercept, lags from oldest to newest]
+    """
+    lags = sliding_window_view(values, p, axis=-1)[:, :-1]
+    design = np.concatenate([np.ones(lags.shape[:2] + (1,)), lags], axis=-1)
+    return (np.linalg.pinv(design) @ values[:, p:, np.newaxis])[..., 0]
+
+
+def predict_ar_batch(values, beta, start):
+    """
+    One step ahead predictions of values[:, start:] for every series, each made from the actual p values before it
+
+    :param values: array of shape (series, n)
+    :param beta: coefficients from fit_ar_batch
+    :param start: index of the first value to predict (at least p)
+    :return: array of shape (series, n - start)
+    """
+    p = beta.shape[1] - 1
+    lags = sliding_window_view(values[:, start - p:-1], p, axis=-1)
+    return beta[:, :1] + np.einsum('snp,sp->sn', lags, beta[:, 1:])
+
+
+def forecast_ar_batch(values, beta, horizon):
+    """
+    Forecasts of the next horizon values of every series, each step using the previous forecasts as lags
+
+    :param values: array of shape (series, n)
+    :param beta: coefficients from fit_ar_batch
+    :param horizon: number of values to forecast
+    :return: array of shape (series, horizon)
+    """
+    p = beta.shape[1] - 1
+    history = np.empty((len(values), p + horizon))
+    history[:, :p] = values[:, values.shape[1] - p:]
+    for step in range(horizon):
+        history[:, p + step] = beta[:, 0] + np.einsum('sp,sp->s', history[:, step:step + p], beta[:, 1:])
+    return history[:, p:]
+
+
+def forecast_ewma_batch(values, alpha, horizon):
+    """
+    :param values: array of shape (series, n)
+    :param alpha: smoothing factor
+    :param horizon: number of values to forecast
+    :return: array of shape (series, horizon), the EWMA forecast is the same for every future day
+    """
+    predictions = ewma_predictions(values, alpha)
+    next_value = alpha * values[:, -1] + (1 - alpha) * predictions[:, -1]
+    return np.repeat(next_value[:, np.newaxis], horizon, axis=1)
+
+
+def fit_models_batch(values, horizon, holdout, ar_orders, ewma_alphas):
+    """
+    :param values: array of shape (series, n) without missing values
+    :return: (holdout predictions of shape (models, series, holdout), forecasts of shape (models, series, horizon))
+    """
+    train_size = values.shape[1] - holdout
+    holdout_predictions = np.empty((len(ar_orders) + len(ewma_alphas), len(values), holdout))
+    forecasts = np.empty((len(ar_orders) + len(ewma_alphas), len(values), horizon))
+    for i, p in enumerate(ar_orders):
+        holdout_predictions[i] = predict_ar_batch(values, fit_ar_batch(values[:, :train_size], p), train_size)
+        forecasts[i] = forecast_ar_batch(values, fit_ar_batch(values, p), horizon)
+    for i, alpha in enumerate(ewma_alphas, start=len(ar_orders)):
+        holdout_predictions[i] = ewma_predictions(values, alpha)[:, -holdout:]
+        forecasts[i] = forecast_ewma_batch(values, alpha, horizon)
+    return holdout_predictions, forecasts
+
+
+def forecast_panel(values, horizon=7, holdout=7, ar_orders=AR_ORDERS, ewma_alphas=EWMA_ALPHAS, series=None,
+                   forecast_dates=None):
+    """
+    Fit AR and EWMA models for every series of a panel.
+    Each model is scored on one step ahead predictions of the last holdout values (fitted on the values before
+    them), then refitted on all the values to forecast the next horizon values.
+    Series are fitted together in batches of series starting on the same date (usually a single batch); series
+    with missing values after their start, or too short to fit, get nan results.
+
+    :param values: array of shape (series, n), in time order along the last axis
+    :param horizon: number of future values to forecast
+    :param holdout: number of values at the end used to score the models
+    :param ar_orders: orders of the AR models
+    :param ewma_alphas: smoothing factors of the EWMA models
+    :param series: labels of the series
+    :param forecast_dates: dates of the forecasts
+    :return: ForecastResult
+    """
+    values = np.asarray(values, dtype=float)
+    models = ['AR({})'.format(p) for p in ar_orders] + ['EWMA({})'.format(alpha) for alpha in ewma_alphas]
+    holdout_predictions = np.full((len(models), len(values), holdout), np.nan)
+    forecasts = np.full((len(models), len(values), horizon), np.nan)
+
+    missing = np.isnan(values)
+    starts = np.argmax(~missing, axis=1)
+    after_start = np.arange(values.shape[1]) >= starts[:, np.newaxis]
+    usable = ~missing.all(axis=1) & ~(missing & after_start).any(axis=1)
+    # fewest values that leave at least one training row more than the coefficients of every AR model
+    min_length = holdout + 2 * (max(ar_orders, default=0) + 1)
+    for start in np.unique(starts[usable]):
+        group = usable & (starts == start)
+        if values.shape[1] - start < min_length:
+            continue
+        holdout_predictions[:, group], forecasts[:, group] = fit_models_batch(
+            values[group, start:], horizon, holdout, ar_orders, ewma_alphas)
+
+    holdout_actuals = values[:, values.shape[1] - holdout:]
+    return ForecastResult(
+        series=np.arange(len(values)) if series is None else np.asarray(series),
+        models=np.array(models),
+        forecast_dates=np.arange(horizon) if forecast_dates is None else np.asarray(forecast_dates),
+        holdout_actuals=holdout_actuals,
+        holdout_predictions=holdout_predictions,
+        mse=mse(holdout_actuals, holdout_predictions),
+        mape=mape(holdout_actuals, holdout_predictions),
+        forecasts=forecasts,
+    )
+
+
+def forecast_data(data, columns, horizon=7, holdout=7, ar_orders=AR_ORDERS, ewma_alphas=EWMA_ALPHAS,
+                  location_col_name='state', date_col_name='submission_date'):
+    """
+    Fit AR and EWMA models for every state x column of the data, with days missing inside a series interpolated
+
+    :param data: dataframe with daily data of one or more states
+    :param columns: columns to forecast
+    :return: ForecastResult, with (state, column) series labels and the dates of the forecasts
+    """
+    series, dates, values = get_panel(data, columns, location_col_name=location_col_name,
+                                      date_col_name=date_col_name)
+    forecast_dates = pd.date_range(pd.Timestamp(dates[-1]) + pd.Timedelta(days=1), periods=horizon)
+    return forecast_panel(values, horizon=horizon, holdout=holdout, ar_orders=ar_orders, ewma_alphas=ewma_alphas,
+                          series=series, forecast_dates=np.array(forecast_dates.strftime('%Y-%m-%d'), dtype=str))
+
+
+def save_forecasts(result, path):
+    """
+    :param result: ForecastResult
+    :param path: .npz file
+    """
+    np.savez_compressed(path, **result._asdict())
+
+
+def load_forecasts(path):
+    """
+    :param path: .npz file written by save_forecasts
+    :return: ForecastResult
+    """
+    with np.load(path) as saved:
+        return ForecastResult(**{field: saved[field] for field in ForecastResult._fields})
+
+
+def run_nightly_forecasts(data, columns, output_dir, name, horizon=7, holdout=7, location_col_name='state',
+                          date_col_name='submission_date'):
+    """
+    Forecast every state x column of the latest data and save the result as <output_dir>/<name>_<last date>.npz
+
+    :param data: dataframe with daily data of all the states
+    :param columns: columns to forecast
+    :param output_dir: directory the forecasts are saved to
+    :param name: name of the dataset in the file name (e.g. 'cases')
+    :return: path of the saved file
+    """
+    result = forecast_data(data, columns, horizon=horizon, holdout=holdout, location_col_name=location_col_name,
+                           date_col_name=date_col_name)
+    last_date = (pd.Timestamp(str(result.forecast_dates[0])) - pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, '{}_{}.npz'.format(name, last_date))
+    save_forecasts(result, path)
+    return path
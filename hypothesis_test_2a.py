@@ -1,35 +1,37 @@
 import math
+import numpy as np
 import pandas as pd
 from scipy.stats import norm, t
+from bootstrap import bootstrap_mean_difference_ci
+from dataset_registry import DatasetRegistry
+from preprocessing import get_date_range
+from results import HypothesisTestResult
+
+# seed for the bootstrap resamples, so the reported intervals are reproducible
+BOOTSTRAP_SEED = 42
 
 
 def filter_time(df, month):
     if month == 3:
-        f1 = df['submission_date'] >= pd.Timestamp(2021, 3, 1)
-        f2 = df['submission_date'] <= pd.Timestamp(2021, 3, 31)
-        return f1 & f2
+        return get_date_range(df, pd.Timestamp(2021, 3, 1), pd.Timestamp(2021, 3, 31), 'submission_date')
     elif month == 2:
-        f1 = df['submission_date'] >= pd.Timestamp(2021, 2, 1)
-        f2 = df['submission_date'] <= pd.Timestamp(2021, 2, 28)
-        return f1 & f2
-    return []
+        return get_date_range(df, pd.Timestamp(2021, 2, 1), pd.Timestamp(2021, 2, 28), 'submission_date')
+    return df.iloc[0:0]
 
 
 def get_mean(df, col):
     return df[col].sum() / df[col].shape[0]
 
 
-def walds_one_sample_test(true_df, predicted_df, column, state, alpha=0.05):
+def walds_one_sample_test(true_df, predicted_df, column, state, alpha=0.05, reporter=print):
     """
         Statistic for Wald's 1 sample test
         W = theta_cap - theta_knot / standard_error(theta_cap)
         :param true_df: Series of data which is hypothesized as the true mean
         :param predicted_df:  Series of data against which to test the hypothesis
+        :param reporter: function called with each line of the report, None to skip the report
+        :return: HypothesisTestResult
    """
-    print("**** WALD'S ONE SAMPLE TEST ****")
-    print(
-        "Testing null hypothesis that the mean of daily {0}s in Feb 2021 is same as March 2021 for state - {1}".format(
-            column, state))
     theta_knot = get_mean(true_df, column)
     theta_cap = get_mean(predicted_df, column)
     # given that data is a poisson distribution, MLE is the same as sample mean which is our parameter lambda
@@ -39,28 +41,36 @@ def walds_one_sample_test(true_df, predicted_df, column, state, alpha=0.05):
     standard_error = math.sqrt(lambda_est_mle / predicted_df.shape[0])
     W = abs(round((theta_cap - theta_knot) / standard_error, 2))
     p_val = round(norm.ppf(1 - (alpha / 2)), 2)
-    print("True Mean = {0:.2f}, Sample Mean = {1:.2f}, Standard Error = {2:.2f}".format(theta_knot, theta_cap,
-                                                                                        standard_error))
-    if W > p_val:
-        print(
+    result = HypothesisTestResult(float(W), float(p_val),
+                                  float(2 * norm.sf(abs(theta_cap - theta_knot) / standard_error)), bool(W > p_val))
+    if reporter is None:
+        return result
+
+    reporter("**** WALD'S ONE SAMPLE TEST ****")
+    reporter(
+        "Testing null hypothesis that the mean of daily {0}s in Feb 2021 is same as March 2021 for state - {1}".format(
+            column, state))
+    reporter("True Mean = {0:.2f}, Sample Mean = {1:.2f}, Standard Error = {2:.2f}".format(theta_knot, theta_cap,
+                                                                                           standard_error))
+    if result.reject_null:
+        reporter(
             "Rejected null hypothesis as the Walds Statistic {0} is greater than the critical value {1} specified.".format(
                 W, p_val))
     else:
-        print(
+        reporter(
             "Accepted null hypothesis as the Walds Statistic {0} is less than or equal to the critical value {1} specified.".format(
                 W, p_val))
-    print()
+    reporter("")
+    return result
 
 
-def walds_two_sample_test(true_df, predicted_df, column, state, alpha=0.05):
+def walds_two_sample_test(true_df, predicted_df, column, state, alpha=0.05, reporter=print):
     """
         Statistic for Wald's two sample test
         W = delta_cap/ standard_error(delta_cap), where delta = sample_mean1 - sample_mean2
+        :param reporter: function called with each line of the report, None to skip the report
+        :return: HypothesisTestResult
    """
-    print("**** WALD'S TWO SAMPLE TEST ****")
-    print(
-        "Testing null hypothesis that the difference in mean of daily {0}s in Feb 2021 and March 2021 is zero for state - {1}".format(
-            column, state))
     delta_0 = get_mean(true_df, column)
     delta_1 = get_mean(predicted_df, column)
     # similar to one sample Wald's test we get lambda_MLE as the sample mean which is also the variance for poisson distribution
@@ -68,56 +78,74 @@ def walds_two_sample_test(true_df, predicted_df, column, state, alpha=0.05):
     standard_error = math.sqrt((delta_0 / true_df.shape[0]) + (delta_1 / predicted_df.shape[0]))
     W = abs(round((delta_1 - delta_0) / standard_error, 2))
     p_val = round(norm.ppf(1 - (alpha / 2)), 2)
-    print("Mean X = {0:.2f}, Mean Y = {1:.2f}, Standard Error = {2:.2f}".format(delta_0, delta_1, standard_error))
-    if W > p_val:
-        print(
+    result = HypothesisTestResult(float(W), float(p_val), float(2 * norm.sf(abs(delta_1 - delta_0) / standard_error)),
+                                  bool(W > p_val))
+    if reporter is None:
+        return result
+
+    reporter("**** WALD'S TWO SAMPLE TEST ****")
+    reporter(
+        "Testing null hypothesis that the difference in mean of daily {0}s in Feb 2021 and March 2021 is zero for state - {1}".format(
+            column, state))
+    reporter("Mean X = {0:.2f}, Mean Y = {1:.2f}, Standard Error = {2:.2f}".format(delta_0, delta_1, standard_error))
+    if result.reject_null:
+        reporter(
             "Rejected null hypothesis as the Wald's Statistic {0} is greater than the critical value {1} specified.".format(
                 W, p_val))
     else:
-        print(
+        reporter(
             "Accepted null hypothesis as the Wald's Statistic {0} is less than or equal to the critical value {1} specified.".format(
                 W, p_val))
-    print()
+    reporter("")
+    return result
 
 
-def t_test(true_df, predicted_df, column, state, alpha=0.05):
+def t_test(true_df, predicted_df, column, state, alpha=0.05, reporter=print):
     """
         Statistic for T-Test two sample test
         T = Sample Mean - True Mean/ std_dev_corr/sqrt(n),
         where std_dev_corr = sqrt(sum(X - sample_mean)^2 / n - 1)
+        :param reporter: function called with each line of the report, None to skip the report
+        :return: HypothesisTestResult
     """
-    print("**** T TEST ****")
-    print(
-        "Testing null hypothesis that the mean of daily {0}s in Feb 2021 is same as March 2021 for state - {1}".format(
-            column, state))
     true_mean = get_mean(true_df, column)
     sample_mean = get_mean(predicted_df, column)
     std_dev = math.sqrt(((predicted_df[column] - sample_mean) ** 2).sum() / predicted_df.shape[0] - 1)
     T = abs(round((sample_mean - true_mean) / (std_dev / math.sqrt(predicted_df.shape[0])), 3))
     # Looking up in T table and keeping degree of freedom as n-1
     p_val = round(t.ppf(1 - (alpha / 2), df=predicted_df.shape[0] - 1), 2)
-    print("True Mean = {0:.2f}, Sample Mean = {1:.2f}, Standard Deviation = {2:.2f}".format(true_mean, sample_mean,
-                                                                                            std_dev))
-    if T > p_val:
-        print(
+    t_statistic = abs(sample_mean - true_mean) / (std_dev / math.sqrt(predicted_df.shape[0]))
+    result = HypothesisTestResult(float(T), float(p_val), float(2 * t.sf(t_statistic, df=predicted_df.shape[0] - 1)),
+                                  bool(T > p_val))
+    if reporter is None:
+        return result
+
+    reporter("**** T TEST ****")
+    reporter(
+        "Testing null hypothesis that the mean of daily {0}s in Feb 2021 is same as March 2021 for state - {1}".format(
+            column, state))
+    reporter("True Mean = {0:.2f}, Sample Mean = {1:.2f}, Standard Deviation = {2:.2f}".format(true_mean, sample_mean,
+                                                                                               std_dev))
+    if result.reject_null:
+        reporter(
             "Rejected null hypothesis as the T Statistic {0} is greater than the critical value {1} specified.".format(
                 T, p_val))
     else:
-        print(
+        reporter(
             "Accepted null hypothesis as the T Statistic {0} is less than or equal to the critical value {1} specified.".format(
                 T, p_val))
-    print()
+    reporter("")
+    return result
 
 
-def t_test_unpaired(X, Y, column, state, alpha=0.05):
+def t_test_unpaired(X, Y, column, state, alpha=0.05, reporter=print):
     """
           Statistic for T-Test two sample test
           T = X_mean - Y_mean/ sqrt(std_dev1^2/n + std_dev2^2/m),
           where std_dev = sqrt(sum(X - sample_mean)^2 / n - 1)
+          :param reporter: function called with each line of the report, None to skip the report
+          :return: HypothesisTestResult
     """
-    print("**** T TEST UNPAIRED ****")
-    print("Testing null hypothesis that the difference in mean of daily {0}s in Feb 2021 and March 2021 is zero for "
-          "state - {1}".format(column, state))
     X_mean = get_mean(X, column)
     Y_mean = get_mean(Y, column)
     std_dev1_2 = ((X[column] - X_mean) ** 2).sum() / X.shape[0] - 1
@@ -126,28 +154,36 @@ def t_test_unpaired(X, Y, column, state, alpha=0.05):
     T = abs(round((X_mean - Y_mean) / pool_stddev, 2))
     # Looking up in T table and keeping degree of freedom as m-1 + n-1 = m+n-2
     p_val = round(t.ppf(1 - (alpha / 2), df=X.shape[0] + Y.shape[0] - 2), 2)
-    print("Mean X = {0:.2f}, Mean Y = {1:.2f}, Standard Deviation = {2:.2f}".format(X_mean, Y_mean, pool_stddev))
-    if T > p_val:
-        print(
+    t_statistic = abs(X_mean - Y_mean) / pool_stddev
+    result = HypothesisTestResult(float(T), float(p_val), float(2 * t.sf(t_statistic, df=X.shape[0] + Y.shape[0] - 2)),
+                                  bool(T > p_val))
+    if reporter is None:
+        return result
+
+    reporter("**** T TEST UNPAIRED ****")
+    reporter("Testing null hypothesis that the difference in mean of daily {0}s in Feb 2021 and March 2021 is zero "
+             "for state - {1}".format(column, state))
+    reporter("Mean X = {0:.2f}, Mean Y = {1:.2f}, Standard Deviation = {2:.2f}".format(X_mean, Y_mean, pool_stddev))
+    if result.reject_null:
+        reporter(
             "Rejected null hypothesis as the T Statistic {0} is greater than the critical value {1} specified.".format(
                 T, p_val))
     else:
-        print(
+        reporter(
             "Accepted null hypothesis as the T Statistic {0} is less than or equal to the critical value {1} specified.".format(
                 T, p_val))
-    print()
+    reporter("")
+    return result
 
 
-def z_test(true_df, predicted_df, df, column, state, alpha=0.05):
+def z_test(true_df, predicted_df, df, column, state, alpha=0.05, reporter=print):
     """
           Statistic for Z-Test One Sample
           T = X_mean - mu_knot/ std_dev/sqrt(n),
           where std_dev is true standard deviation of the distribution
+          :param reporter: function called with each line of the report, None to skip the report
+          :return: HypothesisTestResult
     """
-    print("**** Z-TEST ****")
-    print(
-        "Testing null hypothesis that the mean of daily {0}s in Feb 2021 is same as March 2021 for state - {1}".format(
-            column, state))
     mu_knot = get_mean(true_df, column)
     X_mean = get_mean(predicted_df, column)
     data_mean = get_mean(df, column)
@@ -156,31 +192,69 @@ def z_test(true_df, predicted_df, df, column, state, alpha=0.05):
     std_dev = math.sqrt(((df[column] - data_mean) ** 2).sum() / df.shape[0])
     Z = abs(round((X_mean - mu_knot) / (std_dev / math.sqrt(predicted_df.shape[0])), 2))
     p_val = round(norm.ppf(1 - (alpha / 2)), 2)
-    print("Mean X = {0:.2f}, Mean Y = {1:.2f}, Standard Deviation = {2:.2f}".format(X_mean, mu_knot, std_dev))
-    if Z > p_val:
-        print(
+    z_statistic = abs(X_mean - mu_knot) / (std_dev / math.sqrt(predicted_df.shape[0]))
+    result = HypothesisTestResult(float(Z), float(p_val), float(2 * norm.sf(z_statistic)), bool(Z > p_val))
+    if reporter is None:
+        return result
+
+    reporter("**** Z-TEST ****")
+    reporter(
+        "Testing null hypothesis that the mean of daily {0}s in Feb 2021 is same as March 2021 for state - {1}".format(
+            column, state))
+    reporter("Mean X = {0:.2f}, Mean Y = {1:.2f}, Standard Deviation = {2:.2f}".format(X_mean, mu_knot, std_dev))
+    if result.reject_null:
+        reporter(
             "Rejected null hypothesis as the Z Statistic {0} is greater than the critical value {1} specified.".format(
                 Z, p_val))
     else:
-        print(
+        reporter(
             "Accepted null hypothesis as the Z Statistic {0} is less than or equal to the critical value {1} specified.".format(
                 Z, p_val))
-    print()
+    reporter("")
+    return result
+
 
+def bootstrap_test(true_df, predicted_df, column, state, alpha=0.05, num_replicates=10000, seed=BOOTSTRAP_SEED,
+                   num_workers=1, reporter=print):
+    """
+          Bootstrap confidence interval for the difference in mean of the two samples (Y_mean - X_mean),
+          the null hypothesis of equal means is rejected if the interval does not contain zero.
+          No distribution is assumed for the data, unlike the tests above.
+          :param reporter: function called with each line of the report, None to skip the report
+          :return: BootstrapInterval
+    """
+    interval = bootstrap_mean_difference_ci(true_df[column], predicted_df[column], alpha=alpha,
+                                            num_replicates=num_replicates, seed=seed, num_workers=num_workers)
+    if reporter is None:
+        return interval
+
+    reporter("**** BOOTSTRAP TEST ****")
+    reporter("Testing null hypothesis that the difference in mean of daily {0}s in Feb 2021 and March 2021 is zero "
+             "for state - {1}".format(column, state))
+    reporter("Difference in mean = {0:.2f}, {1:.0f}% confidence interval = [{2:.2f}, {3:.2f}]".format(
+        interval.estimate, 100 * (1 - alpha), interval.lower, interval.upper))
+    if interval.lower > 0 or interval.upper < 0:
+        reporter("Rejected null hypothesis as the confidence interval does not contain zero.")
+    else:
+        reporter("Accepted null hypothesis as the confidence interval contains zero.")
+    reporter("")
+    return interval
+
+
+def run_hyp_tests(registry: DatasetRegistry = None):
+    if registry is None:
+        registry = DatasetRegistry.from_processed_csv(kinds=['cases'])
 
-def run_hyp_tests():
     # Full Dataset of each state
-    data_ct = pd.read_csv("processed/clean_ct_cases.csv")
-    data_fl = pd.read_csv("processed/clean_fl_cases.csv")
-    data_ct['submission_date'] = pd.to_datetime(data_ct.submission_date)
-    data_fl['submission_date'] = pd.to_datetime(data_fl.submission_date)
+    data_ct = registry.get('CT', 'cases')
+    data_fl = registry.get('FL', 'cases')
 
     # filtered on month feb and march
-    feb_df_CT = data_ct[filter_time(data_ct, 2)]
-    mar_df_CT = data_ct[filter_time(data_ct, 3)]
+    feb_df_CT = filter_time(data_ct, 2)
+    mar_df_CT = filter_time(data_ct, 3)
 
-    feb_df_FL = data_fl[filter_time(data_fl, 2)]
-    mar_df_FL = data_fl[filter_time(data_fl, 3)]
+    feb_df_FL = filter_time(data_fl, 2)
+    mar_df_FL = filter_time(data_fl, 3)
 
     print("---- Running Hypothesis Test ----")
     print()
@@ -208,3 +282,158 @@ def run_hyp_tests():
     t_test_unpaired(feb_df_FL, mar_df_FL, 'new_death', 'Florida')
     t_test_unpaired(feb_df_CT, mar_df_CT, 'new_case', 'Connecticut')
     t_test_unpaired(feb_df_CT, mar_df_CT, 'new_death', 'Connecticut')
+
+    bootstrap_test(feb_df_FL, mar_df_FL, 'new_case', 'Florida')
+    bootstrap_test(feb_df_FL, mar_df_FL, 'new_death', 'Florida')
+    bootstrap_test(feb_df_CT, mar_df_CT, 'new_case', 'Connecticut')
+    bootstrap_test(feb_df_CT, mar_df_CT, 'new_death', 'Connecticut')
+
+
+# test kinds supported by run_batch_hyp_tests, in the order of run_hyp_tests
+TEST_KINDS = ['walds_one_sample', 't_test', 'z_test', 'walds_two_sample', 't_test_unpaired']
+
+
+def compute_window_statistics(data, columns, windows, location_col_name='state', date_col_name='submission_date'):
+    """
+    Sufficient statistics (n, count, sum, sum of squares) of every state x window x column.
+    Prefix sums of the values and squared values are computed in one pass over the data sorted by state and date,
+    then the statistics of any window are the difference of two prefix sums found by binary search.
+    As in the single test functions, nan values are left out of the sums but their rows are counted in n.
+
+    :param data: dataframe with data of one or more states
+    :param columns: columns of interest
+    :param windows: list of (start_date, end_date) windows, both inclusive
+    :param location_col_name: location column name
+    :param date_col_name: date column name
+    :return: (states, n, counts, sums, sums_sq) where n (number of rows) has shape (states, windows + 1) and
+             counts (number of non-nan values)/sums/sums_sq have shape (states, windows + 1, columns);
+             the last window is the full data of the state
+    """
+    data = data.sort_values(by=[location_col_name, date_col_name], kind='stable')
+    values = data[columns].to_numpy(dtype=np.float64)
+    # nan values add 0, so a gap does not carry over to the prefix sums of the following rows and states
+    valid = ~np.isnan(values)
+    values = np.where(valid, values, 0.0)
+    # leading row of zeros: the statistics of rows [i, j) are prefix[j] - prefix[i]
+    prefix_counts = np.zeros((len(values) + 1, len(columns)), dtype=np.int64)
+    prefix_sums = np.zeros((len(values) + 1, len(columns)))
+    prefix_sums_sq = np.zeros((len(values) + 1, len(columns)))
+    np.cumsum(valid, axis=0, out=prefix_counts[1:])
+    np.cumsum(values, axis=0, out=prefix_sums[1:])
+    np.cumsum(values ** 2, axis=0, out=prefix_sums_sq[1:])
+
+    dates = data[date_col_name].to_numpy()
+    window_starts = np.array([pd.Timestamp(start).to_datetime64() for start, _ in windows], dtype=dates.dtype)
+    window_ends = np.array([pd.Timestamp(end).to_datetime64() for _, end in windows], dtype=dates.dtype)
+
+    state_codes, states = pd.factorize(data[location_col_name])
+    state_bounds = np.concatenate([[0], np.cumsum(np.bincount(state_codes, minlength=len(states)))])
+
+    starts = np.empty((len(states), len(windows) + 1), dtype=np.int64)
+    ends = np.empty((len(states), len(windows) + 1), dtype=np.int64)
+    for state_code in range(len(states)):
+        first_row, last_row = state_bounds[state_code], state_bounds[state_code + 1]
+        state_dates = dates[first_row:last_row]
+        starts[state_code, :-1] = first_row + np.searchsorted(state_dates, window_starts, side='left')
+        ends[state_code, :-1] = first_row + np.searchsorted(state_dates, window_ends, side='right')
+        starts[state_code, -1], ends[state_code, -1] = first_row, last_row
+
+    n = ends - starts
+    counts = prefix_counts[ends] - prefix_counts[starts]
+    sums = prefix_sums[ends] - prefix_sums[starts]
+    sums_sq = prefix_sums_sq[ends] - prefix_sums_sq[starts]
+    return np.asarray(states), n, counts, sums, sums_sq
+
+
+def run_batch_hyp_tests(data, columns, window_pairs, tests=TEST_KINDS, states=None, location_col_name='state',
+                        date_col_name='submission_date', alpha=0.05):
+    """
+    Run the Wald's, T and Z tests for any number of states, columns and window pairs.
+    Statistics are computed from the cached sufficient statistics of each state x window x column, with the same
+    formulas as the single test functions above.
+
+    :param data: dataframe with data of one or more states
+    :param columns: columns to test
+    :param window_pairs: list of ((start_date, end_date), (start_date, end_date)) pairs, the first window is the one
+                         hypothesized as the true mean (e.g. Feb 2021) and the second one is tested against it
+    :param tests: test kinds to run (see TEST_KINDS)
+    :param states: states to test, None for every state in the data
+    :param location_col_name: location column name
+    :param date_col_name: date column name
+    :param alpha: significance level
+    :return: Dataframe with one row per state x column x window pair x test, the states in the location_col_name
+             column
+    """
+    if states is not None:
+        data = data[data[location_col_name].isin(states)]
+
+    windows = list(dict.fromkeys(window for window_pair in window_pairs for window in window_pair))
+    states, n, counts, sums, sums_sq = compute_window_statistics(data, columns, windows,
+                                                                 location_col_name=location_col_name,
+                                                                 date_col_name=date_col_name)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = sums / n[:, :, np.newaxis]
+        # sum of squared deviations of the non-nan values from the mean (the last term is 0 without nan values)
+        squared_deviations = sums_sq - sums * means - (n[:, :, np.newaxis] - counts) * means ** 2
+
+        results = []
+        for base_window, test_window in window_pairs:
+            base, test = windows.index(base_window), windows.index(test_window)
+            window_stats = {
+                'n_base': n[:, base, np.newaxis], 'n_test': n[:, test, np.newaxis], 'n_all': n[:, -1, np.newaxis],
+                'mean_base': means[:, base], 'mean_test': means[:, test],
+                'ssd_base': squared_deviations[:, base], 'ssd_test': squared_deviations[:, test],
+                'ssd_all': squared_deviations[:, -1],
+            }
+            for test_kind in tests:
+                statistic, critical_value, p_value = _compute_batch_statistic(test_kind, alpha, **window_stats)
+                results.append(pd.DataFrame({
+                    location_col_name: np.repeat(states, len(columns)),
+                    'column': np.tile(columns, len(states)),
+                    'base_window': [base_window] * statistic.size,
+                    'test_window': [test_window] * statistic.size,
+                    'test': test_kind,
+                    'statistic': statistic.ravel(),
+                    'critical_value': critical_value.ravel(),
+                    'p_value': p_value.ravel(),
+                    'reject_null': (statistic > critical_value).ravel(),
+                }))
+    return pd.concat(results, ignore_index=True)
+
+
+def _compute_batch_statistic(test_kind, alpha, n_base, n_test, n_all, mean_base, mean_test, ssd_base, ssd_test,
+                             ssd_all):
+    if test_kind == 'walds_one_sample':
+        standard_error = np.sqrt(mean_test / n_test)
+        raw_statistic = np.abs(mean_test - mean_base) / standard_error
+        p_value = 2 * norm.sf(raw_statistic)
+        statistic = np.abs(np.round((mean_test - mean_base) / standard_error, 2))
+        critical_value = np.round(norm.ppf(1 - (alpha / 2)), 2)
+    elif test_kind == 'walds_two_sample':
+        standard_error = np.sqrt(mean_base / n_base + mean_test / n_test)
+        raw_statistic = np.abs(mean_test - mean_base) / standard_error
+        p_value = 2 * norm.sf(raw_statistic)
+        statistic = np.abs(np.round((mean_test - mean_base) / standard_error, 2))
+        critical_value = np.round(norm.ppf(1 - (alpha / 2)), 2)
+    elif test_kind == 't_test':
+        std_dev = np.sqrt(ssd_test / n_test - 1)
+        raw_statistic = np.abs(mean_test - mean_base) / (std_dev / np.sqrt(n_test))
+        p_value = 2 * t.sf(raw_statistic, df=n_test - 1)
+        statistic = np.abs(np.round((mean_test - mean_base) / (std_dev / np.sqrt(n_test)), 3))
+        critical_value = np.round(t.ppf(1 - (alpha / 2), df=n_test - 1), 2)
+    elif test_kind == 't_test_unpaired':
+        pool_stddev = np.sqrt((ssd_base / n_base - 1) / n_base + (ssd_test / n_test - 1) / n_test)
+        raw_statistic = np.abs(mean_base - mean_test) / pool_stddev
+        p_value = 2 * t.sf(raw_statistic, df=n_base + n_test - 2)
+        statistic = np.abs(np.round((mean_base - mean_test) / pool_stddev, 2))
+        critical_value = np.round(t.ppf(1 - (alpha / 2), df=n_base + n_test - 2), 2)
+    elif test_kind == 'z_test':
+        std_dev = np.sqrt(ssd_all / n_all)
+        raw_statistic = np.abs(mean_test - mean_base) / (std_dev / np.sqrt(n_test))
+        p_value = 2 * norm.sf(raw_statistic)
+        statistic = np.abs(np.round((mean_test - mean_base) / (std_dev / np.sqrt(n_test)), 2))
+        critical_value = np.round(norm.ppf(1 - (alpha / 2)), 2)
+    else:
+        raise ValueError("Unsupported test kind: {}".format(test_kind))
+    return (statistic, np.broadcast_to(critical_value, statistic.shape),
+            np.broadcast_to(p_value, statistic.shape))
@@ -0,0 +1,243 @@
+from typing import Dict
+import os
+import numpy as np
+import pandas as pd
+from preprocessing import get_daily_data, get_outlier_mask, read_cached_data, \
+    write_cached_data, CACHE_DIR, CACHE_FORMAT
+
+INCREMENTAL_STORE_DIR = os.path.join(CACHE_DIR, 'incremental')
+
+# marks the last stored cumulative row of each state, which seeds the daily computation of the new rows
+SEED_COL_NAME = '_is_seed'
+
+
+def update_clean_state_data(new_data, store_name: str, location_col_name: str, date_col_name: str,
+                            non_cumulative_cols=[], set_zero_for_negatives=True,
+                            cols_to_consider=['tot_cases', 'tot_death'], keep_zeros=True,
+                            csv_paths: Dict[str, str] = None, store_dir: str = INCREMENTAL_STORE_DIR):
+    """
+    Append-only update of the clean data with new raw (cumulative) rows.
+
+    The store keeps the daily data before outlier removal, the clean data, the last cumulative row and the tukey
+    quartiles of each state. Daily values of the new rows are computed from the last stored cumulative row, so an
+    update costs O(new rows) as long as the tukey thresholds of a state do not move. The thresholds (and the outlier
+    removal over the full history of the state) are recomputed only when a quartile value actually changes, which
+    is decided from the stored ranks of the quartiles without looking at the history.
+    When the store does not exist yet, new_data is treated as the full history and the store is built from it.
+
+    :param new_data: dataframe of new raw rows for one or more states (rows already in the store are skipped)
+    :param store_name: name of the store (e.g. 'cases' or 'vax')
+    :param location_col_name: location column name
+    :param date_col_name: date column name
+    :param non_cumulative_cols: columns not to be factored in for daily computation
+    :param set_zero_for_negatives: flag to check if negative values need to be made 0
+    :param cols_to_consider: columns to consider while removing outliers
+    :param keep_zeros: flag to check if zero valued outliers should be kept
+    :param csv_paths: processed csv path for each state, updated in place (None skips the csv files)
+    :param store_dir: directory holding the stores
+
+    :return: Dataframe with clean data for every state in the store
+    """
+    store_dir = os.path.join(store_dir, store_name)
+    daily_data = read_cached_data(_get_store_path(store_dir, 'daily'))
+    new_data = new_data.assign(**{date_col_name: pd.to_datetime(new_data[date_col_name])})
+
+    if daily_data is None:
+        print("No incremental store found in {}, building it from the given data".format(store_dir))
+        return _build_store(new_data, store_dir, location_col_name, date_col_name, non_cumulative_cols,
+                            set_zero_for_negatives, cols_to_consider, keep_zeros, csv_paths)
+
+    clean_data = read_cached_data(_get_store_path(store_dir, 'clean'))
+    last_rows = read_cached_data(_get_store_path(store_dir, 'last_rows'))
+    thresholds = read_cached_data(_get_store_path(store_dir, 'thresholds'))
+
+    # keep only rows after the last stored date of their state
+    last_dates = new_data[location_col_name].map(last_rows.set_index(location_col_name)[date_col_name])
+    new_data = new_data[last_dates.isna() | (new_data[date_col_name] > last_dates)]
+    if new_data.empty:
+        print("No new rows for store {}".format(store_name))
+        return clean_data
+    print("New rows per state:\n{}".format(new_data[location_col_name].value_counts()))
+
+    # daily values of the new rows, the stored last cumulative row of each state seeds the diff
+    seed_rows = last_rows[last_rows[location_col_name].isin(new_data[location_col_name])]
+    seeded_data = pd.concat([seed_rows.assign(**{SEED_COL_NAME: True}),
+                             new_data.assign(**{SEED_COL_NAME: False})])
+    new_daily_data, negative_counts = get_daily_data(seeded_data,
+                                                     location_col_name=location_col_name,
+                                                     date_col_name=date_col_name,
+                                                     non_cumulative_cols=list(non_cumulative_cols) + [SEED_COL_NAME],
+                                                     set_zero_for_negatives=set_zero_for_negatives)
+    new_daily_data = new_daily_data[~new_daily_data[SEED_COL_NAME]].drop(columns=SEED_COL_NAME)
+    if set_zero_for_negatives:
+        print("Negative values in daily data:\n{}".format(negative_counts))
+
+    # rows are indexed within each state, continuing after the stored rows
+    stored_sizes = daily_data.groupby(location_col_name, sort=False).size()
+    new_daily_data.index = (new_daily_data.groupby(location_col_name, sort=False).cumcount() +
+                            new_daily_data[location_col_name].map(stored_sizes).fillna(0).astype(int))
+    daily_data = pd.concat([daily_data, new_daily_data])
+
+    changed_states, thresholds = _get_states_with_changed_quartiles(thresholds, new_daily_data,
+                                                                    location_col_name, cols_to_consider)
+    print("States with recomputed tukey thresholds: {}".format(sorted(changed_states)))
+
+    # states with unchanged thresholds: only the new rows need to be checked
+    unchanged_new_daily_data = new_daily_data[~new_daily_data[location_col_name].isin(changed_states)]
+    new_clean_data = unchanged_new_daily_data.loc[
+        ~_get_outlier_mask_for_thresholds(unchanged_new_daily_data, thresholds, location_col_name,
+                                          cols_to_consider, keep_zeros)]
+
+    # states with changed thresholds: outlier removal over their full history
+    changed_daily_data = daily_data[daily_data[location_col_name].isin(changed_states)]
+    changed_clean_data = changed_daily_data.iloc[0:0]
+    if changed_states:
+        outlier_mask, changed_thresholds = get_outlier_mask(changed_daily_data, cols_to_consider=cols_to_consider,
+                                                            keep_zeros=keep_zeros, group_col_name=location_col_name)
+        changed_clean_data = changed_daily_data.loc[~outlier_mask]
+        changed_thresholds = _add_quartile_counts(changed_thresholds, changed_daily_data, location_col_name,
+                                                  cols_to_consider)
+        thresholds = pd.concat([thresholds[~thresholds['group'].isin(changed_states)], changed_thresholds],
+                               ignore_index=True)
+
+    clean_data = pd.concat([clean_data[~clean_data[location_col_name].isin(changed_states)],
+                            new_clean_data, changed_clean_data])
+    last_rows = pd.concat([last_rows, new_data]).sort_values(date_col_name).groupby(
+        location_col_name, sort=False).tail(1)
+
+    _write_store(store_dir, daily_data, clean_data, last_rows, thresholds)
+    if csv_paths is not None:
+        _update_csv(csv_paths, clean_data, new_clean_data, changed_states, location_col_name)
+    return clean_data
+
+
+def _build_store(data, store_dir, location_col_name, date_col_name, non_cumulative_cols, set_zero_for_negatives,
+                 cols_to_consider, keep_zeros, csv_paths):
+    daily_data, negative_counts = get_daily_data(data,
+                                                 location_col_name=location_col_name,
+                                                 date_col_name=date_col_name,
+                                                 non_cumulative_cols=non_cumulative_cols,
+                                                 set_zero_for_negatives=set_zero_for_negatives)
+    if set_zero_for_negatives:
+        print("Negative values in daily data:\n{}".format(negative_counts))
+    daily_data.index = daily_data.groupby(location_col_name, sort=False).cumcount()
+
+    outlier_mask, thresholds = get_outlier_mask(daily_data, cols_to_consider=cols_to_consider,
+                                                keep_zeros=keep_zeros, group_col_name=location_col_name)
+    clean_data = daily_data.loc[~outlier_mask]
+    thresholds = _add_quartile_counts(thresholds, daily_data, location_col_name, cols_to_consider)
+    last_rows = data.sort_values(date_col_name).groupby(location_col_name, sort=False).tail(1)
+
+    _write_store(store_dir, daily_data, clean_data, last_rows, thresholds)
+    if csv_paths is not None:
+        _update_csv(csv_paths, clean_data, clean_data.iloc[0:0], set(clean_data[location_col_name]),
+                    location_col_name)
+    return clean_data
+
+
+def _get_states_with_changed_quartiles(thresholds, new_daily_data, location_col_name, cols_to_consider):
+    """
+    States for which a tukey quartile changes with the new rows.
+    For each quartile the store keeps how many values are smaller than it and how many are equal to it, so the
+    quartile keeps its value exactly when its (new) position still falls in the run of values equal to it.
+
+    :return: (set of changed states, thresholds with updated counts for the unchanged states)
+    """
+    new_states = set(new_daily_data[location_col_name])
+    changed_states = new_states - set(thresholds['group'])
+
+    existing_data = new_daily_data[~new_daily_data[location_col_name].isin(changed_states)]
+    if existing_data.empty:
+        return changed_states, thresholds
+
+    thresholds = thresholds.set_index(['group', 'col'])
+    new_counts = _count_around_quartiles(existing_data, thresholds, location_col_name, cols_to_consider)
+    updated = thresholds.loc[new_counts.index].copy()
+    updated['n'] += new_counts['n']
+    for quartile in ['Q1', 'Q3']:
+        updated[quartile + '_less'] += new_counts[quartile + '_less']
+        updated[quartile + '_equal'] += new_counts[quartile + '_equal']
+
+    Q1_positions, Q3_positions = get_tukey_quartile_positions_array(updated['n'].to_numpy())
+    unchanged = np.ones(len(updated), dtype=bool)
+    for quartile, positions in [('Q1', Q1_positions), ('Q3', Q3_positions)]:
+        less = updated[quartile + '_less'].to_numpy()
+        equal = updated[quartile + '_equal'].to_numpy()
+        unchanged &= (less <= positions) & (positions < less + equal)
+
+    changed_states.update(updated.index.get_level_values('group')[~unchanged])
+    thresholds.loc[updated.index] = updated
+    return changed_states, thresholds.reset_index()
+
+
+def _count_around_quartiles(data, thresholds, location_col_name, cols_to_consider):
+    """
+    Number of values, and number of values smaller than / equal to the quartiles, per state and column
+    """
+    counts = []
+    for col in cols_to_consider:
+        col_thresholds = thresholds.xs(col, level='col')
+        col_counts = pd.DataFrame({'group': data[location_col_name].to_numpy(), 'n': 1})
+        for quartile in ['Q1', 'Q3']:
+            quartile_values = data[location_col_name].map(col_thresholds[quartile]).to_numpy()
+            col_counts[quartile + '_less'] = (data[col].to_numpy() < quartile_values).astype(np.int64)
+            col_counts[quartile + '_equal'] = (data[col].to_numpy() == quartile_values).astype(np.int64)
+        col_counts = col_counts.groupby('group', sort=False).sum()
+        col_counts['col'] = col
+        counts.append(col_counts.set_index('col', append=True))
+    return pd.concat(counts)
+
+
+def get_tukey_quartile_positions_array(n):
+    """
+    Vectorized get_tukey_quartile_positions (same ceil(n * q) convention)
+    """
+    n = np.asarray(n, dtype=np.int64)
+    return -((-n) // 4), -((-3 * n) // 4)
+
+
+def _add_quartile_counts(thresholds, daily_data, location_col_name, cols_to_consider):
+    counts = _count_around_quartiles(daily_data, thresholds.set_index(['group', 'col']), location_col_name,
+                                     cols_to_consider)
+    counts = counts.drop(columns='n').reset_index()
+    return thresholds.merge(counts, on=['group', 'col'], how='left')
+
+
+def _get_outlier_mask_for_thresholds(data, thresholds, location_col_name, cols_to_consider, keep_zeros):
+    """
+    Boolean mask of the outlier rows using stored tukey thresholds of each state
+    """
+    values = data[cols_to_consider].to_numpy()
+    lower_thresholds = thresholds.pivot(index='group', columns='col', values='lower_threshold')
+    upper_thresholds = thresholds.pivot(index='group', columns='col', values='upper_threshold')
+    lower_thresholds = lower_thresholds.loc[data[location_col_name], cols_to_consider].to_numpy()
+    upper_thresholds = upper_thresholds.loc[data[location_col_name], cols_to_consider].to_numpy()
+
+    column_outliers = (values < lower_thresholds) | (values > upper_thresholds)
+    if keep_zeros:
+        column_outliers &= values != 0
+    return column_outliers.any(axis=1)
+
+
+def _get_store_path(store_dir, name):
+    return os.path.join(store_dir, '{}.{}'.format(name, CACHE_FORMAT))
+
+
+def _write_store(store_dir, daily_data, clean_data, last_rows, thresholds):
+    write_cached_data(daily_data, _get_store_path(store_dir, 'daily'))
+    write_cached_data(clean_data, _get_store_path(store_dir, 'clean'))
+    write_cached_data(last_rows, _get_store_path(store_dir, 'last_rows'))
+    write_cached_data(thresholds, _get_store_path(store_dir, 'thresholds'))
+
+
+def _update_csv(csv_paths, clean_data, new_clean_data, changed_states, location_col_name):
+    """
+    Rewrite the csv of states whose clean history changed, append the new clean rows for the other states
+    """
+    for state, path in csv_paths.items():
+        if state in changed_states or not os.path.exists(path):
+            clean_data[clean_data[location_col_name] == state].to_csv(path)
+        else:
+            new_state_rows = new_clean_data[new_clean_data[location_col_name] == state]
+            if not new_state_rows.empty:
+                new_state_rows.to_csv(path, mode='a', header=False)
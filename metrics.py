@@ -0,0 +1,78 @@
+import numpy as np
+
+# ways mape can treat actual values of zero, for which the percentage error is undefined
+ZERO_HANDLING = ['skip', 'nan']
+
+
+def get_errors(y_act, y_pred):
+    """
+    :param y_act: actual values, array of any shape
+    :param y_pred: predicted values, broadcastable to y_act (e.g. one row per model)
+    :return: (actual values, prediction errors y_act - y_pred) as broadcast arrays
+    """
+    y_act = np.asarray(y_act, dtype=float)
+    y_pred = np.asarray(y_pred, dtype=float)
+    return np.broadcast_to(y_act, np.broadcast_shapes(y_act.shape, y_pred.shape)), y_act - y_pred
+
+
+def mse(y_act, y_pred, axis=-1):
+    """
+    :param y_act: actual values
+    :param y_pred: predicted values
+    :param axis: axis along which the errors of one series are averaged
+    :return: mean squared error(s)
+    """
+    _, errors = get_errors(y_act, y_pred)
+    return np.mean(errors ** 2, axis=axis)
+
+
+def rmse(y_act, y_pred, axis=-1):
+    """
+    :return: root mean squared error(s)
+    """
+    return np.sqrt(mse(y_act, y_pred, axis=axis))
+
+
+def mae(y_act, y_pred, axis=-1):
+    """
+    :return: mean absolute error(s)
+    """
+    _, errors = get_errors(y_act, y_pred)
+    return np.mean(np.abs(errors), axis=axis)
+
+
+def mape(y_act, y_pred, axis=-1, zero_handling='skip'):
+    """
+    Mean absolute percentage error (in %)
+
+    :param y_act: actual values
+    :param y_pred: predicted values
+    :param axis: axis along which the errors of one series are averaged
+    :param zero_handling: 'skip' to leave out the points where the actual value is 0 (nan if all of them are 0),
+                          'nan' to return nan for any series with an actual value of 0
+    :return: mean absolute percentage error(s)
+    """
+    if zero_handling not in ZERO_HANDLING:
+        raise ValueError("Unsupported zero handling for MAPE: {}".format(zero_handling))
+    y_act, errors = get_errors(y_act, y_pred)
+    nonzero = y_act != 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentage_errors = np.where(nonzero, np.abs(errors) / np.abs(y_act), 0.0)
+        result = 100 * percentage_errors.sum(axis=axis) / nonzero.sum(axis=axis)
+    if zero_handling == 'nan':
+        result = np.where(nonzero.all(axis=axis), result, np.nan)
+    return result
+
+
+def smape(y_act, y_pred, axis=-1):
+    """
+    Symmetric mean absolute percentage error (in %, between 0 and 200).
+    Points where both the actual and predicted values are 0 are predicted exactly, so they count as 0 error.
+
+    :return: symmetric mean absolute percentage error(s)
+    """
+    y_act, errors = get_errors(y_act, y_pred)
+    denominator = np.abs(y_act) + np.abs(y_act - errors)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentage_errors = np.where(denominator > 0, 2 * np.abs(errors) / denominator, 0.0)
+    return 100 * np.mean(percentage_errors, axis=axis)
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+
+def compute_moments(values, axis=0):
+    """
+    Size, mean and (population) variance of the values, skipping nan values.
+    The variance is the mean squared deviation from the mean, which is computed first, so it does not lose
+    precision like the sum of squares formula does for large counts.
+
+    :param values: array of values (or series)
+    :param axis: axis to reduce
+    :return: (n, mean, variance), scalars for 1-D values and arrays otherwise
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    n = valid.sum(axis=axis)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(valid, values, 0.0).sum(axis=axis) / n
+        deviations = np.where(valid, values - np.expand_dims(mean, axis), 0.0)
+        variance = (deviations ** 2).sum(axis=axis) / n
+    return n, mean, variance
+
+
+def compute_segment_moments(values, starts):
+    """
+    Size, mean and (population) variance of consecutive segments of rows, skipping nan values.
+    Same two passes as compute_moments, with segment sums (np.add.reduceat) instead of full sums.
+
+    :param values: 2-D array of values, one row per observation
+    :param starts: increasing start row of each segment, the first one 0 (segments must not be empty)
+    :return: (n, mean, variance) arrays of shape (segments, columns)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    n = np.add.reduceat(valid.astype(np.int64), starts, axis=0)
+    # segment of every row
+    segments = np.repeat(np.arange(len(starts)), np.diff(starts, append=len(values)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.add.reduceat(np.where(valid, values, 0.0), starts, axis=0) / n
+        deviations = np.where(valid, values - mean[segments], 0.0)
+        variance = np.add.reduceat(deviations ** 2, starts, axis=0) / n
+    return n, mean, variance
+
+
+def compute_group_moments(data, columns, group_col_name='state'):
+    """
+    Size, mean and (population) variance of every column for every group, skipping nan values.
+    The rows are sorted by group once, then every group x column is reduced by compute_segment_moments.
+
+    :param data: dataframe with data of one or more groups (e.g. states)
+    :param columns: columns of interest
+    :param group_col_name: column the data is grouped by
+    :return: (n, mean, variance) dataframes indexed by group, with one column per column of interest
+    """
+    codes, groups = pd.factorize(data[group_col_name], sort=True)
+    # rows without a group are left out, as in groupby
+    data, codes = data[codes >= 0], codes[codes >= 0]
+    order = np.argsort(codes, kind='stable')
+    starts = np.searchsorted(codes[order], np.arange(len(groups)))
+    values = data[columns].to_numpy(dtype=np.float64)[order]
+
+    index = pd.Index(groups, name=group_col_name)
+    return tuple(pd.DataFrame(moment, index=index, columns=columns)
+                 for moment in compute_segment_moments(values, starts))
@@ -1,136 +1,183 @@
-from permutation_test import compute_sample_mean
-from two_ks_test import get_ecdf_for_point, generate_ecdf
+from moments import compute_moments, compute_group_moments
+from ecdf import ECDF
 from scipy.stats import poisson
 from scipy.stats import geom
 from scipy.stats import binom
+import numpy as np
 import pandas as pd
+from scipy.stats import kstwo, kstwobign
+from results import HypothesisTestResult
 
 
 def compute_sample_variance(data):
-    mean = compute_sample_mean(data)
-    sum_val = 0
-    for val in data:
-        sum_val += (val - mean) ** 2
-    return sum_val / len(data)
-
-
-def get_poisson_mme(data):
+    _, _, variance = compute_moments(data)
+    return variance
+
+
+def compute_mme_parameters(mean, variance):
+    """
+    MME parameters of the Poisson, Geometric and Binomial distributions, for scalar or array moments
+
+    :param mean: sample mean(s)
+    :param variance: sample (population) variance(s)
+    :return: Dict[parameter name, value(s)]
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # n_mme = mean^2/(mean-variance)
+        n_mme = mean ** 2 / (mean - variance)
+        return {
+            # lambda_mme = mean
+            'poisson_lambda': mean,
+            # p_mme = 1/mean
+            'geometric_p': 1 / mean,
+            'binomial_n': n_mme,
+            # p_mme = mean/n_mme
+            'binomial_p': mean / n_mme,
+        }
+
+
+def get_poisson_mme(data, reporter=print):
     # lambda_mme = mean
-    mean = compute_sample_mean(data)
-    print("Poisson: \nMME value for lambda: {}".format(mean))
+    _, mean, _ = compute_moments(data)
+    if reporter is not None:
+        reporter("Poisson: \nMME value for lambda: {}".format(mean))
     return mean
 
 
-def get_geometric_mme(data):
+def get_geometric_mme(data, reporter=print):
     # p_mme = 1/mean
-    p = 1 / compute_sample_mean(data)
-    print("Geometric: \nMME value for p: {}".format(p))
+    _, mean, _ = compute_moments(data)
+    p = 1 / mean
+    if reporter is not None:
+        reporter("Geometric: \nMME value for p: {}".format(p))
     return p
 
 
-def get_binomial_mme(data):
-    # n_mme = mean^2/(mean-variance)
-    # p_mme = mean/n_mme
-    mean = compute_sample_mean(data)
-    var = compute_sample_variance(data)
-
-    n_mme = mean ** 2 / (mean - var)
-    p_mme = mean / n_mme
-    print("Binomial: \nMME value for n: {}, p: {}".format(n_mme, p_mme))
+def get_binomial_mme(data, reporter=print):
+    # mean and variance come from one pass over the data
+    _, mean, variance = compute_moments(data)
+    params = compute_mme_parameters(mean, variance)
+    n_mme, p_mme = params['binomial_n'], params['binomial_p']
+    if reporter is not None:
+        reporter("Binomial: \nMME value for n: {}, p: {}".format(n_mme, p_mme))
     return [n_mme, p_mme]
 
 
-def estimate_parameters(data, dist):
+def estimate_parameters(data, dist, reporter=print):
     if dist == 'Poisson':
-        return get_poisson_mme(data)
+        return get_poisson_mme(data, reporter=reporter)
     elif dist == 'Geometric':
-        return get_geometric_mme(data)
+        return get_geometric_mme(data, reporter=reporter)
     elif dist == 'Binomial':
-        return get_binomial_mme(data)
+        return get_binomial_mme(data, reporter=reporter)
     return None
 
 
-def compute_one_ks_pvalue(x_vals, params, dist_name, data, col_name):
-    ks_values = []
-
-    # compute table column values for each x
-    for x in x_vals:
-        # ecdf to the left of x for state 2's distribution
-        F_left = get_ecdf_for_point(data, col_name, x, 'eCDF', left=True)
-        # ecdf to the right of x for state 1's distribution
-        F_right = get_ecdf_for_point(data, col_name, x, 'eCDF')
-
-        # Fx is the cdf of distribution at x
-        if dist_name == 'Poisson':
-            lambda_mme = params
-            Fx = poisson.cdf(x, lambda_mme)
-
-        elif dist_name == 'Geometric':
-            p_mme = params
-            Fx = geom.cdf(x, p_mme)
-
-        elif dist_name == 'Binomial':
-            n_mme, p_mme = params
-            if n_mme < 0 or p_mme < 0:
-                print("Invalid MME param for distribution: {}, n_mme: {}, p_mme: {}".format(dist_name, n_mme, p_mme))
-                return
-            Fx = binom.cdf(x, n_mme, p_mme)
-        else:
-            print("Unsupported distributed for one sample KS test: {}".format(dist_name))
-            return
-        # difference between left ecdf and Fx values
-        abs_diff_left = round(abs(F_left - Fx), 4)
-        # difference between right ecdf and Fx values
-        abs_diff_right = round(abs(F_right - Fx), 4)
-
-        ks_values.append(
-            {'x': x,
-             'F_left': F_left,
-             'F_right': F_right,
-             'Fx': Fx,
-             'abs_diff_left': abs_diff_left,
-             'abs_diff_right': abs_diff_right
-             })
-
-    # table for all KS values
-    table_ks = pd.DataFrame(ks_values, columns=['x', 'F_left', 'F_right', 'Fx',
-                                                'abs_diff_left', 'abs_diff_right'])
+def estimate_all_parameters(data, columns, location_col_name='state'):
+    """
+    MME parameters of every distribution for every state x column, in one vectorized call
+
+    :param data: dataframe with data of one or more states
+    :param columns: columns of interest
+    :param location_col_name: location column name
+    :return: dataframe indexed by (state, column) with n, mean, variance and the MME parameters
+    """
+    n, mean, variance = compute_group_moments(data, columns, group_col_name=location_col_name)
+    moments = pd.DataFrame({'n': n.stack(), 'mean': mean.stack(), 'variance': variance.stack()})
+    moments.index.names = [location_col_name, 'column']
+    params = compute_mme_parameters(moments['mean'].to_numpy(), moments['variance'].to_numpy())
+    return moments.assign(**params)
+
+
+def get_distribution_cdf(x_vals, params, dist_name):
+    """
+    :param x_vals: 1-D array of points
+    :param params: MME parameters of the distribution
+    :param dist_name: 'Poisson', 'Geometric' or 'Binomial'
+    :return: cdf of the distribution at every point
+    """
+    if dist_name == 'Poisson':
+        lambda_mme = params
+        return poisson.cdf(x_vals, lambda_mme)
+    elif dist_name == 'Geometric':
+        p_mme = params
+        return geom.cdf(x_vals, p_mme)
+    elif dist_name == 'Binomial':
+        n_mme, p_mme = params
+        return binom.cdf(x_vals, n_mme, p_mme)
+    raise ValueError("Unsupported distribution: {}".format(dist_name))
+
+
+def compute_one_ks_pvalue(ecdf, params, dist_name, col_name, exact=True, reporter=print):
+    """
+    One sample KS test of the data against a distribution with the given parameters.
+    The cdf of the distribution is evaluated at every distinct value in one call, and the eCDF to the left
+    and right of each value is found with binary search.
+
+    :param ecdf: ECDF of the sample
+    :param exact: flag to use the exact distribution of d for the p-value, otherwise the asymptotic one
+    :param reporter: function called with each line of the report, None to skip the report
+    :return: HypothesisTestResult, or None if the distribution or its parameters are not supported
+    """
+    if dist_name not in ('Poisson', 'Geometric', 'Binomial'):
+        if reporter is not None:
+            reporter("Unsupported distributed for one sample KS test: {}".format(dist_name))
+        return None
+    if dist_name == 'Binomial':
+        n_mme, p_mme = params
+        if n_mme < 0 or p_mme < 0:
+            if reporter is not None:
+                reporter("Invalid MME param for distribution: {}, n_mme: {}, p_mme: {}".format(dist_name, n_mme, p_mme))
+            return None
+
+    n = ecdf.n
+    x_vals = ecdf.values
+    F_left, F_right = ecdf.ks_limits(x_vals)
+    # Fx is the cdf of distribution at x
+    Fx = get_distribution_cdf(x_vals, params, dist_name)
+    # difference between left ecdf and Fx values
+    abs_diff_left = np.round(np.abs(F_left - Fx), 4)
+    # difference between right ecdf and Fx values
+    abs_diff_right = np.round(np.abs(F_right - Fx), 4)
 
     # Calculate KS statistic
-    # max of right ecdf values
-    max_d_right = table_ks['abs_diff_right'].max()
-    # max of left ecdf values
-    max_d_left = table_ks['abs_diff_left'].max()
-    # max of both values
-    d = max(max_d_right, max_d_left)
+    # max of both left and right differences, points where the cdf is undefined (nan) are skipped
+    d = float(np.fmax(np.fmax.reduce(abs_diff_right), np.fmax.reduce(abs_diff_left)))
     critical_value = 0.05
-    if d > critical_value:
-        print(
+    p_value = kstwo.sf(d, n) if exact else kstwobign.sf(np.sqrt(n) * d)
+    result = HypothesisTestResult(d, critical_value, float(p_value), bool(d > critical_value))
+    if reporter is None:
+        return result
+
+    if result.reject_null:
+        reporter(
             "One sample KS Test for col: {} rejects the null hypothesis.\nThe statistic d is {}, which is more than the critical-value: {}".format(
                 col_name, d, critical_value
             ))
-        print()
+        reporter("")
     else:
-        print(
+        reporter(
             "One sample KS Test for col: {} accepts the null hypothesis.\nThe statistic d is {}, which is less than the critical-value: {}".format(
                 col_name, d, critical_value
             ))
-        print()
+        reporter("")
+    return result
+
 
+def one_sample_KS_test(state1_data, state2_data, col_name, distributions=['Poisson', 'Geometric', 'Binomial'],
+                       reporter=print):
+    """
+    One sample KS test of state 2 data against each distribution, with parameters estimated (MME) on state 1 data
 
-def one_sample_KS_test(state1_data, state2_data, col_name, distributions=['Poisson', 'Geometric', 'Binomial']):
+    :param reporter: function called with each line of the report, None to skip the report
+    :return: Dict[distribution, HypothesisTestResult or None]
+    """
+    # Take data from state 2 for KS test, its eCDF is shared by all the distributions
+    ecdf = ECDF.from_data(state2_data[col_name])
+    results = {}
     for dist in distributions:
         # use state1_data for the column to estimate distribution parameter (MME)
-        params = estimate_parameters(state1_data[col_name], dist)
-
-        # Take data from state 2 for KS test
-        # sort the data by column on which we are performing the KS Test
-        state2_data_sorted = state2_data.sort_values(col_name)
-        # compute ecdf for the distribution
-        state2_data_sorted['eCDF'] = generate_ecdf(state2_data_sorted.shape[0])
-        # we keep last value for each x point since that is the one with final ecdf value for that point
-        state2_data_sorted_distinct = state2_data_sorted.drop_duplicates(subset=col_name, keep="last").reset_index(
-            drop=True)
-
-        x_vals = state2_data_sorted_distinct[col_name].to_numpy()
-        compute_one_ks_pvalue(x_vals, params, dist, state2_data_sorted_distinct, col_name)
+        params = estimate_parameters(state1_data[col_name], dist, reporter=reporter)
+
+        results[dist] = compute_one_ks_pvalue(ecdf, params, dist, col_name, reporter=reporter)
+    return results
@@ -0,0 +1,150 @@
+import os
+import numpy as np
+import pandas as pd
+from ecdf import ECDF
+from parallel import get_seed_sequence, map_tasks
+from permutation_test import compute_permutation_pvalues_shared
+from results import PairwiseTestMatrices
+from two_ks_test import compute_two_sample_ks, compute_two_sample_ks_pvalue
+
+
+def get_quarter_windows(start_date, num_windows, step_months=3):
+    """
+    :param start_date: first day of the first quarter
+    :param num_windows: number of windows
+    :param step_months: months between the start of consecutive windows (3 for back to back quarters)
+    :return: list of (start_date, end_date) windows of three months, both inclusive
+    """
+    starts = pd.date_range(start_date, periods=num_windows, freq=pd.DateOffset(months=step_months))
+    return [(start, start + pd.DateOffset(months=3) - pd.Timedelta(days=1)) for start in starts]
+
+
+def get_window_samples(data, col_name, windows, location_col_name='state', date_col_name='submission_date'):
+    """
+    Values of the column for every state x window, each sorted once into an ECDF.
+    The data is sorted by state and date once and the rows of every window are found with binary search.
+
+    :param data: dataframe with data of one or more states
+    :param windows: list of (start_date, end_date) windows, both inclusive
+    :return: (states, samples, ecdfs) where samples[w][i] holds the values of state i in window w and
+             ecdfs[w][i] their ECDF
+    """
+    data = data.sort_values(by=[location_col_name, date_col_name], kind='stable')
+    values = data[col_name].to_numpy(dtype=np.float64)
+    dates = data[date_col_name].to_numpy()
+    window_starts = np.array([pd.Timestamp(start).to_datetime64() for start, _ in windows], dtype=dates.dtype)
+    window_ends = np.array([pd.Timestamp(end).to_datetime64() for _, end in windows], dtype=dates.dtype)
+
+    state_codes, states = pd.factorize(data[location_col_name])
+    state_bounds = np.concatenate([[0], np.cumsum(np.bincount(state_codes, minlength=len(states)))])
+
+    samples = [[None] * len(states) for _ in windows]
+    ecdfs = [[None] * len(states) for _ in windows]
+    for state_code in range(len(states)):
+        first_row, last_row = state_bounds[state_code], state_bounds[state_code + 1]
+        state_dates = dates[first_row:last_row]
+        starts = first_row + np.searchsorted(state_dates, window_starts, side='left')
+        ends = first_row + np.searchsorted(state_dates, window_ends, side='right')
+        for window, (start, end) in enumerate(zip(starts, ends)):
+            sample = values[start:end]
+            samples[window][state_code] = sample[~np.isnan(sample)]
+            ecdfs[window][state_code] = ECDF.from_data(sample)
+    return np.asarray(states), samples, ecdfs
+
+
+def compute_pairwise_row(task):
+    """
+    KS and permutation tests of one state against every state, in one window.
+    Permutation tests are only run against the states after it (the test is symmetric), sharing one set of
+    permutations among the states with the same number of values.
+
+    :param task: (state index, samples and ECDFs of all states in the window, number of permutations, seed)
+    :return: (KS statistics, KS p-values, T-obs values, permutation p-values), one value per state
+    """
+    state, samples, ecdfs, num_permutations, seed = task
+    num_states = len(samples)
+    ks_statistic, ks_p_value = np.full(num_states, np.nan), np.full(num_states, np.nan)
+    permutation_statistic, permutation_p_value = np.full(num_states, np.nan), np.full(num_states, np.nan)
+    if ecdfs[state].n == 0:
+        return ks_statistic, ks_p_value, permutation_statistic, permutation_p_value
+
+    others = [other for other in range(num_states) if other != state and ecdfs[other].n > 0]
+    for other in others:
+        # the KS statistic is evaluated at the points of the second sample, so it is computed for both orders
+        d = compute_two_sample_ks(ecdfs[state], ecdfs[other])
+        ks_statistic[other] = d
+        ks_p_value[other] = compute_two_sample_ks_pvalue(d, ecdfs[state].n, ecdfs[other].n)
+
+    later_others = np.array([other for other in others if other > state], dtype=np.int64)
+    sizes = np.array([len(samples[other]) for other in later_others], dtype=np.int64)
+    for size, size_seed in zip(np.unique(sizes), seed.spawn(len(np.unique(sizes)))):
+        group = later_others[sizes == size]
+        permutation_statistic[group], permutation_p_value[group] = compute_permutation_pvalues_shared(
+            samples[state], [samples[other] for other in group], num_permutations, seed=size_seed)
+    return ks_statistic, ks_p_value, permutation_statistic, permutation_p_value
+
+
+def run_pairwise_tests(data, col_name, windows, states=None, location_col_name='state',
+                       date_col_name='submission_date', num_permutations=1000, seed=None, num_workers=1,
+                       output_path=None):
+    """
+    Two-sample KS and permutation tests for every pair of states, in every window.
+    The values of each state x window are sorted once and shared by all the pairs, and the rows of the matrices
+    (one state against all the others, in one window) are spread over a pool of worker processes.
+
+    :param data: dataframe with data of one or more states
+    :param col_name: column to test
+    :param windows: list of (start_date, end_date) windows, both inclusive (e.g. from get_quarter_windows)
+    :param states: states to test, None for every state in the data
+    :param location_col_name: location column name
+    :param date_col_name: date column name
+    :param num_permutations: number of permutations for each permutation test
+    :param seed: seed for the permutations (None for fresh entropy)
+    :param num_workers: number of worker processes
+    :param output_path: .npz file to save the matrices to (None to skip)
+    :return: PairwiseTestMatrices
+    """
+    if states is not None:
+        data = data[data[location_col_name].isin(states)]
+    states, samples, ecdfs = get_window_samples(data, col_name, windows, location_col_name=location_col_name,
+                                                date_col_name=date_col_name)
+
+    num_states = len(states)
+    seeds = get_seed_sequence(seed).spawn(len(windows) * num_states)
+    tasks = [(state, samples[window], ecdfs[window], num_permutations, seeds[window * num_states + state])
+             for window in range(len(windows)) for state in range(num_states)]
+    rows = map_tasks(compute_pairwise_row, tasks, num_workers)
+
+    # matrices of shape (windows, states, states)
+    ks_statistic, ks_p_value, permutation_statistic, permutation_p_value = [
+        np.stack([row[i] for row in rows]).reshape(len(windows), num_states, num_states) for i in range(4)]
+    # copy the upper triangle of the permutation test results to the lower one
+    lower = np.tril_indices(num_states, -1)
+    permutation_statistic[:, lower[0], lower[1]] = permutation_statistic[:, lower[1], lower[0]]
+    permutation_p_value[:, lower[0], lower[1]] = permutation_p_value[:, lower[1], lower[0]]
+
+    window_labels = np.array([[pd.Timestamp(start).strftime('%Y-%m-%d'), pd.Timestamp(end).strftime('%Y-%m-%d')]
+                              for start, end in windows])
+    matrices = PairwiseTestMatrices(states.astype(str), window_labels, ks_statistic, ks_p_value,
+                                    permutation_statistic, permutation_p_value)
+    if output_path is not None:
+        save_pairwise_matrices(matrices, output_path)
+    return matrices
+
+
+def save_pairwise_matrices(matrices, path):
+    """
+    :param matrices: PairwiseTestMatrices
+    :param path: .npz file
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    np.savez_compressed(path, **matrices._asdict())
+
+
+def load_pairwise_matrices(path):
+    """
+    :param path: .npz file written by save_pairwise_matrices
+    :return: PairwiseTestMatrices
+    """
+    with np.load(path) as saved:
+        return PairwiseTestMatrices(**{field: saved[field] for field in PairwiseTestMatrices._fields})
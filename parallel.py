@@ -0,0 +1,66 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+
+class SerialExecutor:
+    """
+    Runs the tasks in the calling process, with the same interface as a process pool.
+    Used when a single worker is requested, so the callers do not need two code paths.
+    """
+
+    def map(self, func, *iterables):
+        return map(func, *iterables)
+
+    def shutdown(self, wait=True):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+        return False
+
+
+def get_executor(num_workers=1):
+    """
+    :param num_workers: number of worker processes (None or 1 to run in the calling process)
+    :return: executor with map, to be used as a context manager
+    """
+    if num_workers is None or num_workers <= 1:
+        return SerialExecutor()
+    return ProcessPoolExecutor(max_workers=num_workers)
+
+
+def map_tasks(func, tasks, num_workers=1):
+    """
+    Run a function over the tasks on a pool of worker processes
+
+    :param func: top level function (so it can be sent to the workers), called with one task
+    :param tasks: list of task arguments
+    :param num_workers: number of worker processes (None or 1 to run in the calling process)
+    :return: List of results, in the order of the tasks
+    """
+    with get_executor(num_workers) as executor:
+        return list(executor.map(func, tasks))
+
+
+def get_seed_sequence(seed=None):
+    """
+    :param seed: int seed, or None for fresh entropy
+    :return: SeedSequence to spawn independent random streams from, one per task
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+def get_batch_sizes(num_items, batch_size):
+    """
+    :param num_items: total number of items (e.g. permutations or bootstrap replicates)
+    :param batch_size: maximum number of items in a batch
+    :return: List of batch sizes adding up to num_items
+    """
+    num_batches = math.ceil(num_items / batch_size)
+    return [batch_size] * (num_batches - 1) + [num_items - batch_size * (num_batches - 1)]
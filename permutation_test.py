@@ -1,66 +1,188 @@
-import random
-
 import numpy as np
-
-random.seed(42)
+from scipy.stats import beta
+from moments import compute_moments
+from parallel import get_batch_sizes, get_executor, get_seed_sequence, map_tasks
+from results import HypothesisTestResult
 
 
 def compute_sample_mean(data):
-    sum_val = 0
-    for val in data:
-        sum_val += val
-    return sum_val / len(data)
-
-
-def compute_statistic_for_permutations(num_permutations, data1, data2):
-    d1 = data1.to_list()
-    d2 = data2.to_list()
-
-    d1_size = len(d1)
-
-    # combine both datasets
-    combined_data = d1 + d2
-
-    # computed statistic values
-    T_i_list = []
-
-    for permutation in range(num_permutations):
-        permuted_data = np.random.permutation(combined_data)
-
-        # divide the permuted list into two parts of size proportionate to d1 and d2
-        d1_new_mean = compute_sample_mean(permuted_data[:d1_size])
-        d2_new_mean = compute_sample_mean(permuted_data[d1_size:])
-
-        T_i = abs(d1_new_mean - d2_new_mean)
-        T_i_list.append(T_i)
-    return T_i_list
-
-
-def permutation_test(state1_data, state2_data, col_name):
-    # compute the mean for both sample sets
-    state1_mean = compute_sample_mean(state1_data[col_name])
-    state2_mean = compute_sample_mean(state2_data[col_name])
+    _, mean, _ = compute_moments(data)
+    return mean
+
+
+def compute_mean_difference(group_sums, total_sum, d1_size, d2_size):
+    """
+    :param group_sums: sum(s) of the first group
+    :param total_sum: sum of both groups
+    :return: absolute difference between the means of the two groups
+    """
+    return np.abs(group_sums / d1_size - (total_sum - group_sums) / d2_size)
+
+
+def compute_permutation_batch(task):
+    """
+    Statistic for a batch of random permutations of the combined data.
+    Every row of the index matrix is one permutation, the means come from one reduction over the first group
+    and the precomputed total sum.
+
+    :param task: (combined data, total sum, size of first group, number of permutations, seed)
+    :return: array of statistic values
+    """
+    combined_data, total_sum, d1_size, num_permutations, seed = task
+    rng = np.random.default_rng(seed)
+    n = len(combined_data)
+    d2_size = n - d1_size
+    # the statistic is symmetric, so only the smaller group needs to be summed
+    group_size = min(d1_size, d2_size)
+    indices = rng.permuted(np.tile(np.arange(n), (num_permutations, 1)), axis=1)[:, :group_size]
+    group_sums = combined_data[indices].sum(axis=1)
+    return compute_mean_difference(group_sums, total_sum, group_size, n - group_size)
+
+
+def get_permutation_tasks(combined_data, total_sum, d1_size, batch_sizes, seed_sequence):
+    """
+    :param batch_sizes: number of permutations in each batch
+    :param seed_sequence: SeedSequence, an independent random stream is spawned for every batch
+    :return: List of tasks for compute_permutation_batch
+    """
+    seeds = seed_sequence.spawn(len(batch_sizes))
+    return [(combined_data, total_sum, d1_size, batch_size, seed) for batch_size, seed in zip(batch_sizes, seeds)]
+
+
+def compute_statistic_for_permutations(num_permutations, data1, data2, batch_size=1000, seed=None, num_workers=1):
+    """
+    :param num_permutations: number of random permutations
+    :param batch_size: number of permutations generated together
+    :param seed: seed for the random streams (None for fresh entropy)
+    :param num_workers: number of worker processes the batches are spread over
+    :return: array of statistic values, one for each permutation
+    """
+    combined_data = np.concatenate([np.asarray(data1, dtype=float), np.asarray(data2, dtype=float)])
+    tasks = get_permutation_tasks(combined_data, combined_data.sum(), len(data1),
+                                  get_batch_sizes(num_permutations, batch_size), get_seed_sequence(seed))
+    return np.concatenate(map_tasks(compute_permutation_batch, tasks, num_workers))
+
+
+def compute_permutation_pvalues_shared(data1, data2_list, num_permutations=1000, batch_size=1000, seed=None):
+    """
+    Permutation p-values of one sample against several samples of the same size.
+    The same random permutations are used for all the pairs, so the group sums of a batch are one product of a
+    0/1 group membership matrix with the combined data of every pair.
+
+    :param data1: values of the first sample
+    :param data2_list: list of samples of equal size, each tested against data1
+    :param num_permutations: number of random permutations
+    :param batch_size: number of permutations generated together
+    :param seed: seed for the permutations (None for fresh entropy)
+    :return: (T-obs values, p-values), one value per sample in data2_list
+    """
+    data1 = np.asarray(data1, dtype=float)
+    d1_size = len(data1)
+    data2 = np.column_stack([np.asarray(d2, dtype=float) for d2 in data2_list])
+    d2_size = data2.shape[0]
+    # combined data of each pair in its own column
+    combined_data = np.concatenate([np.repeat(data1[:, np.newaxis], data2.shape[1], axis=1), data2])
+    total_sums = combined_data.sum(axis=0)
+
+    # initial statistic values
+    T_obs = compute_mean_difference(data1.sum(), total_sums, d1_size, d2_size)
+
+    rng = np.random.default_rng(get_seed_sequence(seed))
+    num_extreme_vals = np.zeros(data2.shape[1], dtype=np.int64)
+    for size in get_batch_sizes(num_permutations, batch_size):
+        indices = rng.permuted(np.tile(np.arange(d1_size + d2_size), (size, 1)), axis=1)[:, :d1_size]
+        membership = np.zeros((size, d1_size + d2_size))
+        np.put_along_axis(membership, indices, 1.0, axis=1)
+        T_i = compute_mean_difference(membership @ combined_data, total_sums, d1_size, d2_size)
+        num_extreme_vals += np.count_nonzero(T_i > T_obs, axis=0)
+    return T_obs, num_extreme_vals / num_permutations
+
+
+def get_pvalue_bounds(num_extreme_vals, num_permutations, error=0.001):
+    """
+    Clopper-Pearson interval for the p-value estimated from the permutations done so far
+
+    :param error: probability of the true p-value lying outside the interval
+    :return: (lower bound, upper bound)
+    """
+    lower = 0.0 if num_extreme_vals == 0 else \
+        beta.ppf(error / 2, num_extreme_vals, num_permutations - num_extreme_vals + 1)
+    upper = 1.0 if num_extreme_vals == num_permutations else \
+        beta.ppf(1 - error / 2, num_extreme_vals + 1, num_permutations - num_extreme_vals)
+    return lower, upper
+
+
+def compute_permutation_pvalue(data1, data2, num_permutations=1000, batch_size=1000, seed=None, num_workers=1,
+                               early_stopping=False, alpha=0.05, error=0.001):
+    """
+    Permutation p-value for the difference of means of two samples.
+    With early stopping, the batches are run in rounds (one batch per worker) and the test stops as soon as
+    the interval for the p-value lies entirely above or below alpha.
+
+    :param num_permutations: (maximum) number of random permutations
+    :param batch_size: number of permutations generated together
+    :param seed: seed for the random streams (None for fresh entropy)
+    :param num_workers: number of worker processes the batches are spread over
+    :param early_stopping: flag to stop once the p-value is clearly above or below alpha
+    :param error: probability of the p-value interval used for early stopping being wrong
+    :return: (T-obs, p-value, number of permutations done)
+    """
+    combined_data = np.concatenate([np.asarray(data1, dtype=float), np.asarray(data2, dtype=float)])
+    total_sum = combined_data.sum()
+    d1_size = len(data1)
 
     # initial statistic value
-    T_obs = abs(state1_mean - state2_mean)
+    T_obs = compute_mean_difference(combined_data[:d1_size].sum(), total_sum, d1_size, len(data2))
 
-    # compute the statistic for permutations of data
-    T_i_list = compute_statistic_for_permutations(1000, state1_data[col_name], state2_data[col_name])
+    seed_sequence = get_seed_sequence(seed)
+    batch_sizes = get_batch_sizes(num_permutations, batch_size)
+    round_size = max(num_workers or 1, 1) if early_stopping else len(batch_sizes)
 
     num_extreme_vals = 0
-    for T_i in T_i_list:
-        if T_i > T_obs:
-            num_extreme_vals += 1
-
-    p_val = num_extreme_vals / 1000
+    num_done = 0
+    with get_executor(num_workers) as executor:
+        for start in range(0, len(batch_sizes), round_size):
+            tasks = get_permutation_tasks(combined_data, total_sum, d1_size, batch_sizes[start:start + round_size],
+                                          seed_sequence)
+            for T_i in executor.map(compute_permutation_batch, tasks):
+                num_extreme_vals += int(np.count_nonzero(T_i > T_obs))
+                num_done += len(T_i)
+
+            if early_stopping:
+                lower, upper = get_pvalue_bounds(num_extreme_vals, num_done, error)
+                if upper < alpha or lower > alpha:
+                    break
+    return float(T_obs), num_extreme_vals / num_done, num_done
+
+
+def permutation_test(state1_data, state2_data, col_name, num_permutations=1000, seed=None, num_workers=1,
+                     early_stopping=False, reporter=print):
+    """
+    Permutation test for the difference of means of a column in two states
+
+    :param num_permutations: (maximum) number of random permutations
+    :param seed: seed for the random streams (None for fresh entropy)
+    :param num_workers: number of worker processes the permutations are spread over
+    :param early_stopping: flag to stop once the p-value is clearly above or below the critical-value
+    :param reporter: function called with each line of the report, None to skip the report
+    :return: HypothesisTestResult, the statistic is T-obs
+    """
     critical_value = 0.05
-    if p_val <= critical_value:
-        print(
+    T_obs, p_val, _ = compute_permutation_pvalue(state1_data[col_name], state2_data[col_name], num_permutations,
+                                                 seed=seed, num_workers=num_workers, early_stopping=early_stopping,
+                                                 alpha=critical_value)
+    result = HypothesisTestResult(float(T_obs), critical_value, float(p_val), bool(p_val <= critical_value))
+    if reporter is None:
+        return result
+
+    if result.reject_null:
+        reporter(
             "Permutation test for col: {} rejects the null hypothesis.\nT-obs is {} and p-value is {}, which is less than the critical-value: {}".format(
                 col_name, T_obs, p_val, critical_value
             ))
     else:
-        print(
+        reporter(
             "Permutation test for col: {} accepts the null hypothesis.\nT-obs is {} and p-value is {}, which is more than the critical-value: {}".format(
                 col_name, T_obs, p_val, critical_value
             ))
+    return result
@@ -1,28 +1,68 @@
 from typing import Dict, Any, List
 import pandas as pd
 import numpy as np
+import hashlib
+import json
 import math
+import os
+
+try:
+    import pyarrow  # noqa: F401
+    CACHE_FORMAT = 'parquet'
+except ImportError:
+    # fall back to pickle which also keeps dtypes (and parsed dates) without any extra dependency
+    CACHE_FORMAT = 'pickle'
+
+CACHE_DIR = './cache'
+
+# fingerprints computed in this process, keyed by (path, size, mtime) so a file is hashed at most once per run
+_file_fingerprints = {}
 
 
 def get_state_data(filename: str, states: List[str], cols: List[str], location_col_name='state',
-                   remove_nan: bool = True):
+                   remove_nan: bool = True, chunksize: int = None, dtypes: Dict[str, Any] = None,
+                   cache_dir: str = None):
     """
     Select data corresponding to each state
     Additionally, remove missing (nan) values
 
+    When chunksize is given, the file is streamed: only the requested columns are parsed (with the given dtypes),
+    rows are filtered to the requested states chunk by chunk and the filtered rows are split per state in a single
+    groupby pass. Peak memory is then bounded by the chunk size instead of the full file.
+
     :param filename: data path for full data
     :param states: states for which we want data
     :param cols: columns of interest
     :param location_col_name: column name of location
     :param remove_nan: flag to check if nan values need to be removed
+    :param chunksize: number of rows to read per chunk (None reads the full file at once)
+    :param dtypes: dtypes for the columns of interest, used when streaming
+    :param cache_dir: directory for the typed per-state extracts (None disables caching)
 
     :return: List[dataframe]: data corresponding to each state
     """
-    data_df = pd.read_csv(filename)
+    cache_path = None
+    grouped_states = None
+    if cache_dir is not None:
+        cache_path = get_cache_path(filename, {'stage': 'raw', 'states': states, 'cols': cols,
+                                               'location_col_name': location_col_name, 'dtypes': dtypes},
+                                    cache_dir=cache_dir)
+        cached_df = read_cached_data(cache_path)
+        if cached_df is not None:
+            grouped_states = _split_by_location(cached_df, states, location_col_name)
+
+    if grouped_states is None:
+        if chunksize is None:
+            data_df = pd.read_csv(filename)
+            grouped_states = {state: data_df.loc[data_df[location_col_name] == state, cols] for state in states}
+        else:
+            grouped_states = _read_state_chunks(filename, states, cols, location_col_name, chunksize, dtypes)
+        if cache_path is not None:
+            write_cached_data(pd.concat([grouped_states[state][cols] for state in states]), cache_path)
+
     states_data = []
     for state in states:
-        state_data = data_df.loc[data_df[location_col_name] == state]
-        state_data_cols = state_data[cols]
+        state_data_cols = grouped_states[state][cols]
         total_rows = state_data_cols.shape[0]
         if remove_nan:
             state_data_cols = state_data_cols.dropna()
@@ -32,6 +72,210 @@ def get_state_data(filename: str, states: List[str], cols: List[str], location_c
     return states_data
 
 
+def _read_state_chunks(filename, states, cols, location_col_name, chunksize, dtypes=None):
+    """
+    Stream the file in chunks and split the rows of the requested states into one dataframe per state
+
+    :return: Dict[state, dataframe]
+    """
+    usecols = list(cols) if location_col_name in cols else list(cols) + [location_col_name]
+    col_dtypes = dict(dtypes or {})
+    # locations outside of the requested states are parsed as nan, so the filter is a null check
+    col_dtypes[location_col_name] = pd.CategoricalDtype(states)
+
+    state_chunks = []
+    with pd.read_csv(filename, usecols=usecols, dtype=col_dtypes, chunksize=chunksize) as reader:
+        for chunk in reader:
+            state_chunks.append(chunk[chunk[location_col_name].notna()])
+
+    if state_chunks:
+        filtered_df = pd.concat(state_chunks)
+    else:
+        filtered_df = pd.DataFrame(columns=usecols)
+    filtered_df[location_col_name] = filtered_df[location_col_name].astype(str)
+
+    return _split_by_location(filtered_df, states, location_col_name)
+
+
+def _split_by_location(data, states, location_col_name):
+    grouped_states = {state: data.iloc[0:0] for state in states}
+    for state, state_data in data.groupby(location_col_name, sort=False):
+        if state in grouped_states:
+            grouped_states[state] = state_data
+    return grouped_states
+
+
+def get_date_range(data, start_date, end_date, date_col_name=None):
+    """
+    Rows of the data between two dates (both inclusive).
+    When the data is sorted by date, the bounds are found by binary search (O(log n)) and the rows are returned as a
+    positional slice, without building a boolean mask over the full data. Unsorted data falls back to the mask.
+
+    :param data: dataframe, preferably sorted by date
+    :param start_date: first date of the range
+    :param end_date: last date of the range
+    :param date_col_name: date column name, None to use the DatetimeIndex of the data
+    :return: dataframe with the rows in the date range
+    """
+    dates = data.index if date_col_name is None else data[date_col_name]
+    if not dates.is_monotonic_increasing:
+        return data[(dates >= pd.Timestamp(start_date)) & (dates <= pd.Timestamp(end_date))]
+    start = dates.searchsorted(pd.Timestamp(start_date), side='left')
+    end = dates.searchsorted(pd.Timestamp(end_date), side='right')
+    return data.iloc[start:end]
+
+
+def get_file_fingerprint(filename: str):
+    """
+    Identify the contents of a source file by its size, modification time and hash
+
+    :param filename: path of the source file
+    :return: Dict with size, mtime_ns and sha1 of the file
+    """
+    file_stat = os.stat(filename)
+    stat_key = (os.path.abspath(filename), file_stat.st_size, file_stat.st_mtime_ns)
+    if stat_key not in _file_fingerprints:
+        sha1 = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(block)
+        _file_fingerprints[stat_key] = {'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns,
+                                        'sha1': sha1.hexdigest()}
+    return _file_fingerprints[stat_key]
+
+
+def get_cache_path(filename: str, params: Dict[str, Any], cache_dir: str = CACHE_DIR):
+    """
+    Cache file path for data derived from a source file
+
+    :param filename: path of the source file
+    :param params: parameters used to derive the data (part of the cache key)
+    :param cache_dir: directory holding the cached files
+    :return: path of the cache entry
+    """
+    key = json.dumps({'source': get_file_fingerprint(filename), 'params': params}, sort_keys=True, default=str)
+    key_hash = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(cache_dir, '{}_{}.{}'.format(name, key_hash[:16], CACHE_FORMAT))
+
+
+def read_cached_data(cache_path: str):
+    """
+    Read a cache entry
+
+    :param cache_path: path of the cache entry
+    :return: dataframe, or None if there is no entry
+    """
+    if not os.path.exists(cache_path):
+        return None
+    if CACHE_FORMAT == 'parquet':
+        return pd.read_parquet(cache_path)
+    return pd.read_pickle(cache_path)
+
+
+def write_cached_data(data, cache_path: str):
+    """
+    Write a cache entry
+
+    :param data: dataframe to store
+    :param cache_path: path of the cache entry
+    """
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    # write to a temporary file first so an interrupted run never leaves a partial entry behind
+    tmp_path = cache_path + '.tmp'
+    if CACHE_FORMAT == 'parquet':
+        data.to_parquet(tmp_path)
+    else:
+        data.to_pickle(tmp_path)
+    os.replace(tmp_path, cache_path)
+
+
+def read_processed_data(filename: str, date_col_name: str, cache_dir: str = CACHE_DIR):
+    """
+    Read a cleaned dataset written by the driver, with the date column parsed
+
+    :param filename: path of the processed csv
+    :param date_col_name: date column name
+    :param cache_dir: directory for the typed copy of the csv (None disables caching)
+    :return: dataframe with cleaned data
+    """
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = get_cache_path(filename, {'stage': 'processed', 'date_col_name': date_col_name},
+                                    cache_dir=cache_dir)
+        cached_df = read_cached_data(cache_path)
+        if cached_df is not None:
+            return cached_df
+
+    data = pd.read_csv(filename, index_col=0)
+    data[date_col_name] = pd.to_datetime(data[date_col_name])
+    if cache_path is not None:
+        write_cached_data(data, cache_path)
+    return data
+
+
+def get_clean_state_data(filename: str, states: List[str], cols: List[str], location_col_name: str,
+                         date_col_name: str, non_cumulative_cols=[], set_zero_for_negatives=True,
+                         cols_to_consider=['tot_cases', 'tot_death'], keep_zeros=True, chunksize: int = None,
+                         dtypes: Dict[str, Any] = None, cache_dir: str = CACHE_DIR):
+    """
+    Full cleaning pipeline (state selection, daily data, outlier removal) for the given states.
+    The cleaned data is cached, keyed by the source file and the cleaning parameters.
+
+    :param filename: data path for full data
+    :param states: states for which we want data
+    :param cols: columns of interest
+    :param location_col_name: column name of location
+    :param date_col_name: date column name
+    :param non_cumulative_cols: columns not to be factored in for daily computation
+    :param set_zero_for_negatives: flag to check if negative values need to be made 0
+    :param cols_to_consider: columns to consider while removing outliers
+    :param keep_zeros: flag to check if zero valued outliers should be kept
+    :param chunksize: number of rows to read per chunk (None reads the full file at once)
+    :param dtypes: dtypes for the columns of interest, used when streaming
+    :param cache_dir: directory holding the cached files (None disables caching)
+
+    :return: List[dataframe]: clean data corresponding to each state
+    """
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = get_cache_path(filename, {'stage': 'clean', 'states': states, 'cols': cols,
+                                               'location_col_name': location_col_name,
+                                               'date_col_name': date_col_name,
+                                               'non_cumulative_cols': non_cumulative_cols,
+                                               'set_zero_for_negatives': set_zero_for_negatives,
+                                               'cols_to_consider': cols_to_consider,
+                                               'keep_zeros': keep_zeros, 'dtypes': dtypes},
+                                    cache_dir=cache_dir)
+        cached_df = read_cached_data(cache_path)
+        if cached_df is not None:
+            print("Loaded clean data for states {} from cache: {}".format(states, cache_path))
+            grouped_states = _split_by_location(cached_df, states, location_col_name)
+            return [grouped_states[state] for state in states]
+
+    states_data = get_state_data(filename=filename, states=states, cols=cols,
+                                 location_col_name=location_col_name, chunksize=chunksize, dtypes=dtypes,
+                                 cache_dir=cache_dir)
+    daily_data, negative_counts = get_daily_data(pd.concat(states_data),
+                                                 location_col_name=location_col_name,
+                                                 date_col_name=date_col_name,
+                                                 non_cumulative_cols=non_cumulative_cols,
+                                                 set_zero_for_negatives=set_zero_for_negatives)
+    if set_zero_for_negatives:
+        print("Negative values in daily data:\n{}".format(negative_counts))
+
+    # index rows within each state, as if every state was processed on its own
+    daily_data.index = daily_data.groupby(location_col_name, sort=False).cumcount()
+    clean_data = remove_outliers(daily_data, cols_to_consider=cols_to_consider, keep_zeros=keep_zeros,
+                                 group_col_name=location_col_name)
+    grouped_states = _split_by_location(clean_data, states, location_col_name)
+    clean_states_data = [grouped_states[state] for state in states]
+
+    if cache_path is not None:
+        write_cached_data(pd.concat(clean_states_data), cache_path)
+    return clean_states_data
+
+
 def get_daily_cases_data(data, location_col_name='state', date_col_name='submission_date',
                          non_cumulative_cols=[], set_zero_for_negatives=True):
     """
@@ -44,80 +288,284 @@ def get_daily_cases_data(data, location_col_name='state', date_col_name='submiss
     :param set_zero_for_negatives: flag to check if negative values need to be made 0
     :return: Dataframe with daily data
     """
-    daily_data_df = pd.DataFrame()
-
-    # sort dataset by date (this is needed for daily data computation from cumulative)
-    data[date_col_name] = pd.to_datetime(data[date_col_name])
-    data = data.sort_values(by=date_col_name).reset_index(drop=True)
-
-    for col in data:
-        if col == date_col_name or col == location_col_name or col in non_cumulative_cols:
-            daily_data_df[col] = data[col]
-            continue
-        # computing the daily values by subtracting prev row values
-        daily_data_df[col] = data[col].diff().fillna(data.iloc[0][col])
-        if set_zero_for_negatives:
-            # some values were negative (e.g. when number of cases is corrected)
-            # replacing those with zero
-            negative_values = len(daily_data_df[daily_data_df[col] < 0])
-            daily_data_df[col][daily_data_df[col] < 0] = 0
+    daily_data_df, negative_counts = get_daily_data(data,
+                                                    location_col_name=location_col_name,
+                                                    date_col_name=date_col_name,
+                                                    non_cumulative_cols=non_cumulative_cols,
+                                                    set_zero_for_negatives=set_zero_for_negatives)
+    if set_zero_for_negatives:
+        for col, negative_values in negative_counts.sum().items():
             print("{} negative values in daily data for col {}".format(negative_values, col))
 
     return daily_data_df
 
 
+def get_daily_data(data, location_col_name='state', date_col_name='submission_date',
+                   non_cumulative_cols=[], set_zero_for_negatives=True):
+    """
+    Daily data extracted from cumulative data, for any number of states at once.
+    The diff, first row fill and negative clipping are done for all cumulative columns with grouped operations.
+
+    :param data: dataframe of raw data for one or more states
+    :param location_col_name: location column name
+    :param date_col_name: date column name
+    :param non_cumulative_cols: columns not to be factored in for daily computation
+    :param set_zero_for_negatives: flag to check if negative values need to be made 0
+    :return: (Dataframe with daily data sorted by location and date,
+              Dataframe with count of negative values corrected per location and column)
+    """
+    # sort dataset by location and date (this is needed for daily data computation from cumulative)
+    data = data.assign(**{date_col_name: pd.to_datetime(data[date_col_name])})
+    data = data.sort_values(by=[location_col_name, date_col_name]).reset_index(drop=True)
+
+    cumulative_cols = [col for col in data
+                       if col not in (date_col_name, location_col_name) and col not in non_cumulative_cols]
+    grouped_data = data.groupby(location_col_name, sort=False)[cumulative_cols]
+
+    # computing the daily values by subtracting prev row values, the first row of each state keeps its value
+    daily_values = grouped_data.diff().fillna(grouped_data.transform('first'))
+
+    negative_mask = daily_values < 0
+    if set_zero_for_negatives:
+        # some values were negative (e.g. when number of cases is corrected)
+        # replacing those with zero
+        negative_counts = negative_mask.groupby(data[location_col_name], sort=False).sum()
+        daily_values = daily_values.mask(negative_mask, 0)
+    else:
+        negative_counts = negative_mask.iloc[0:0].groupby(data[location_col_name], sort=False).sum()
+
+    data[cumulative_cols] = daily_values
+    return data, negative_counts
+
+
 def compute_tukey_parameters(data_col):
-    alpha = 1.5
+    lower_thresholds, upper_thresholds, IQRs = compute_tukey_thresholds(np.asarray(data_col).reshape(-1, 1))
+    return lower_thresholds[0], upper_thresholds[0], IQRs[0]
 
-    sorted_col_data = np.array(data_col.sort_values())
-    n = len(sorted_col_data)
 
-    Q1_idx = math.ceil(n * 0.25)
-    Q3_idx = math.ceil(n * 0.75)
+def compute_tukey_thresholds(values, alpha=1.5):
+    """
+    Tukey's rule thresholds for every column of a matrix.
 
-    IQR = sorted_col_data[Q3_idx] - sorted_col_data[Q1_idx]
+    :param values: 2-D array, one column per variable
+    :param alpha: multiplier of the IQR
+    :return: (lower thresholds, upper thresholds, IQRs), one value per column
+    """
+    Q1, Q3 = compute_tukey_quartiles(values)
+    IQR = Q3 - Q1
 
-    lower_threshold = sorted_col_data[Q1_idx] - alpha * IQR
-    upper_threshold = sorted_col_data[Q3_idx] + alpha * IQR
+    lower_threshold = Q1 - alpha * IQR
+    upper_threshold = Q3 + alpha * IQR
 
     return lower_threshold, upper_threshold, IQR
 
 
-def remove_outliers(data, cols_to_consider=['tot_cases', 'tot_death'], keep_zeros=True, keep_outliers=False):
+def compute_tukey_quartiles(values):
+    """
+    Q1 and Q3 for every column of a matrix.
+    They are found with a partial partition (O(n)) instead of a full sort, the quantile positions follow the
+    ceil(n * q) convention.
+
+    :param values: 2-D array, one column per variable
+    :return: (Q1, Q3), one value per column
+    """
+    Q1_idx, Q3_idx = get_tukey_quartile_positions(values.shape[0])
+    partitioned_values = np.partition(values, [Q1_idx, Q3_idx], axis=0)
+    return partitioned_values[Q1_idx], partitioned_values[Q3_idx]
+
+
+def get_tukey_quartile_positions(n):
+    """
+    :param n: number of values
+    :return: (Q1 position, Q3 position) in the sorted values
+    """
+    return math.ceil(n * 0.25), math.ceil(n * 0.75)
+
+
+def get_outlier_mask(data, cols_to_consider=['tot_cases', 'tot_death'], keep_zeros=True, group_col_name=None):
+    """
+    Boolean mask of the outlier rows based on tukey's rule
+
+    :param data: Main dataframe
+    :param cols_to_consider: Columns to consider while finding outliers
+    :param keep_zeros: Flag to check if zero valued outliers should be kept
+    :param group_col_name: when given, thresholds are computed separately for each value of this column (e.g. state)
+
+    :return: (numpy array with True for outlier rows,
+              Dataframe with thresholds and outlier count per group and column)
+    """
+    values = data[cols_to_consider].to_numpy()
+    if group_col_name is None:
+        group_codes = np.zeros(len(data), dtype=np.intp)
+        groups = [None]
+    else:
+        group_codes, groups = pd.factorize(data[group_col_name])
+
+    # quartiles for each group, row i of these matrices belongs to groups[i]
+    Q1 = np.empty((len(groups), len(cols_to_consider)))
+    Q3 = np.empty((len(groups), len(cols_to_consider)))
+    group_sizes = np.bincount(group_codes, minlength=len(groups))
+    group_positions = np.split(np.argsort(group_codes, kind='stable'), np.cumsum(group_sizes)[:-1])
+    for group_code, positions in enumerate(group_positions):
+        Q1[group_code], Q3[group_code] = compute_tukey_quartiles(values[positions])
+
+    IQRs = Q3 - Q1
+    lower_thresholds = Q1 - 1.5 * IQRs
+    upper_thresholds = Q3 + 1.5 * IQRs
+
+    column_outliers = (values < lower_thresholds[group_codes]) | (values > upper_thresholds[group_codes])
+    # we want to remove non-zero outliers
+    if keep_zeros:
+        column_outliers &= values != 0
+
+    outlier_counts = np.zeros((len(groups), len(cols_to_consider)), dtype=np.int64)
+    np.add.at(outlier_counts, group_codes, column_outliers)
+
+    thresholds = pd.DataFrame({
+        'group': np.repeat(np.asarray(groups, dtype=object), len(cols_to_consider)),
+        'col': np.tile(cols_to_consider, len(groups)),
+        'outlier_count': outlier_counts.ravel(),
+        'lower_threshold': lower_thresholds.ravel(),
+        'upper_threshold': upper_thresholds.ravel(),
+        'IQR': IQRs.ravel(),
+        'n': np.repeat(group_sizes, len(cols_to_consider)),
+        'Q1': Q1.ravel(),
+        'Q3': Q3.ravel(),
+    })
+    return column_outliers.any(axis=1), thresholds
+
+
+def remove_outliers(data, cols_to_consider=['tot_cases', 'tot_death'], keep_zeros=True, keep_outliers=False,
+                    group_col_name=None):
     """
     Remove non-zero outliers from the data
     :param data: Main dataframe
     :param cols_to_consider: Columns to consider while removing outliers
     :param keep_zeros: Flag to check if zero valued outliers should be kept
     :param keep_outliers: Flag to check if outliers should not be removed
+    :param group_col_name: when given, thresholds are computed separately for each value of this column (e.g. state)
 
     :return: Dataframe with clean data
     """
-    outlier_idx = set()
-    clean_df = pd.DataFrame()
+    outlier_mask, thresholds = get_outlier_mask(data, cols_to_consider=cols_to_consider, keep_zeros=keep_zeros,
+                                                group_col_name=group_col_name)
+
+    for row in thresholds.itertuples():
+        prefix = "" if group_col_name is None else "State: {}, ".format(row.group)
+        print("{}Col: {}, Outlier count: {}, lower_threshold: {}, upper_threshold: {}, IQR: {}".format(
+            prefix, row.col, row.outlier_count, row.lower_threshold, row.upper_threshold, row.IQR))
+
+    if keep_outliers:
+        return data.copy()
+
+    print("Total outlier rows removed: {}".format(outlier_mask.sum()))
+    return data.loc[~outlier_mask]
+
+
+class HousingData:
+    """
+    Zillow home value index (ZHVI) as a float32 matrix of metros x months, memory-mapped from disk.
+    Metros are stored grouped by state, so a state, a metro and a date range are all plain slices of the matrix.
+    """
+
+    def __init__(self, values, metros, dates):
+        """
+        :param values: 2-D array (metros x dates) of home values
+        :param metros: dataframe with one row per metro (RegionID, SizeRank, RegionName, RegionType, StateName)
+        :param dates: DatetimeIndex of the months
+        """
+        self.values = values
+        self.metros = metros
+        self.dates = dates
+
+        self._metro_rows = {name: row for row, name in enumerate(metros['RegionName'])}
+        self._state_rows = {}
+        states = metros['StateName'].to_numpy()
+        # rows without a state (the country level row) are only reachable by metro name
+        for state in pd.unique(states[metros['StateName'].notna().to_numpy()]):
+            rows = np.flatnonzero(states == state)
+            self._state_rows[state] = slice(rows[0], rows[-1] + 1)
 
-    for col in data:
-        if col not in cols_to_consider:
-            clean_df[col] = data[col]
-            continue
+    @classmethod
+    def load(cls, filename: str, cache_dir: str = CACHE_DIR):
+        """
+        Load the wide ZHVI csv, converting it to the memory-mapped form on first use
 
-        clean_df[col] = data[col]
+        :param filename: path of the wide ZHVI csv
+        :param cache_dir: directory holding the converted data
+        :return: HousingData
+        """
+        cache_path = get_cache_path(filename, {'stage': 'housing'}, cache_dir=cache_dir)
+        housing_dir = os.path.splitext(cache_path)[0]
+        if not os.path.exists(os.path.join(housing_dir, 'values.npy')):
+            convert_housing_data(filename, housing_dir)
 
-        # remove outliers based on tukey's rule
-        lower_threshold, upper_threshold, IQR = compute_tukey_parameters(data[col])
-        column_outliers = clean_df[col][((clean_df[col] < lower_threshold) | (clean_df[col] > upper_threshold))].index
+        values = np.load(os.path.join(housing_dir, 'values.npy'), mmap_mode='r')
+        dates = pd.DatetimeIndex(np.load(os.path.join(housing_dir, 'dates.npy')))
+        metros = read_cached_data(os.path.join(housing_dir, 'metros.{}'.format(CACHE_FORMAT)))
+        return cls(values, metros, dates)
 
-        # we want to remove non-zero outliers
-        if keep_zeros:
-            zero_outliers = clean_df[col][clean_df[col] == 0].index
-            column_outliers = column_outliers.difference(zero_outliers)
+    def get_date_slice(self, start_date=None, end_date=None):
+        """
+        :param start_date: first date of the range (inclusive), None for the first month
+        :param end_date: last date of the range (inclusive), None for the last month
+        :return: slice of the date axis
+        """
+        start = 0 if start_date is None else self.dates.searchsorted(pd.Timestamp(start_date), side='left')
+        end = len(self.dates) if end_date is None else self.dates.searchsorted(pd.Timestamp(end_date), side='right')
+        return slice(start, end)
 
-        outlier_idx = outlier_idx.union(column_outliers)
-        print("Col: {}, Outlier count: {}, lower_threshold: {}, upper_threshold: {}, IQR: {}".format(
-            col, len(column_outliers), lower_threshold, upper_threshold, IQR))
+    def get_state_values(self, state: str, start_date=None, end_date=None):
+        """
+        :return: view of the matrix (metros of the state x dates in range)
+        """
+        rows = self._state_rows.get(state, slice(0, 0))
+        return self.values[rows, self.get_date_slice(start_date, end_date)]
+
+    def get_state(self, state: str, start_date=None, end_date=None):
+        """
+        :param state: state abbreviation (e.g. 'CT')
+        :param start_date: first date of the range (inclusive)
+        :param end_date: last date of the range (inclusive)
+        :return: Dataframe indexed by date with one column per metro of the state
+        """
+        rows = self._state_rows.get(state, slice(0, 0))
+        date_slice = self.get_date_slice(start_date, end_date)
+        return pd.DataFrame(self.values[rows, date_slice].T, index=self.dates[date_slice],
+                            columns=self.metros['RegionName'].iloc[rows])
+
+    def get_metro(self, metro: str, start_date=None, end_date=None):
+        """
+        :param metro: metro name as in the RegionName column (e.g. 'Hartford, CT')
+        :param start_date: first date of the range (inclusive)
+        :param end_date: last date of the range (inclusive)
+        :return: Series of home values indexed by date
+        """
+        date_slice = self.get_date_slice(start_date, end_date)
+        return pd.Series(self.values[self._metro_rows[metro], date_slice], index=self.dates[date_slice], name=metro)
+
+
+def convert_housing_data(filename: str, output_dir: str):
+    """
+    Convert the wide ZHVI csv to a float32 matrix (values.npy), a date index (dates.npy) and
+    the metro metadata, with metros grouped by state
+
+    :param filename: path of the wide ZHVI csv
+    :param output_dir: directory for the converted data
+    """
+    header = pd.read_csv(filename, nrows=0).columns
+    metro_cols = ['RegionID', 'SizeRank', 'RegionName', 'RegionType', 'StateName']
+    date_cols = [col for col in header if col not in metro_cols]
 
-    if not keep_outliers:
-        print("Total outlier rows removed: {}".format(len(outlier_idx)))
-        clean_df.drop(outlier_idx, inplace=True)
+    wide_df = pd.read_csv(filename, dtype={col: np.float32 for col in date_cols})
+    wide_df = wide_df.sort_values(by=['StateName', 'SizeRank'], na_position='first').reset_index(drop=True)
 
-    return clean_df
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, 'dates.npy'), pd.to_datetime(date_cols).to_numpy(dtype='datetime64[D]'))
+    write_cached_data(wide_df[metro_cols], os.path.join(output_dir, 'metros.{}'.format(CACHE_FORMAT)))
+    # values.npy marks a complete conversion (see HousingData.load), so it is written last, through a
+    # temporary file as in write_cached_data
+    values_path = os.path.join(output_dir, 'values.npy')
+    with open(values_path + '.tmp', 'wb') as f:
+        np.save(f, wide_df[date_cols].to_numpy(dtype=np.float32))
+    os.replace(values_path + '.tmp', values_path)
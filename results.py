@@ -0,0 +1,63 @@
+from typing import NamedTuple
+import numpy as np
+
+
+class HypothesisTestResult(NamedTuple):
+    """
+    Outcome of a hypothesis test, with plain python values (e.g. for json.dumps)
+    """
+    statistic: float
+    critical_value: float
+    p_value: float
+    reject_null: bool
+
+
+class PosteriorResult(NamedTuple):
+    """
+    Gamma posterior of the Poisson rate after a week of data, with its mean and credible interval
+    """
+    week: int
+    alpha: float
+    beta: float
+    map_estimate: float
+    mean: float
+    lower: float
+    upper: float
+
+
+class PairwiseTestMatrices(NamedTuple):
+    """
+    KS and permutation test results for every pair of states in every window.
+    Matrices have shape (windows, states, states), entry [w, i, j] compares state i (first sample) with state j
+    """
+    states: np.ndarray
+    windows: np.ndarray
+    ks_statistic: np.ndarray
+    ks_p_value: np.ndarray
+    permutation_statistic: np.ndarray
+    permutation_p_value: np.ndarray
+
+
+class BootstrapInterval(NamedTuple):
+    """
+    Bootstrap estimate with its percentile confidence interval
+    """
+    estimate: float
+    lower: float
+    upper: float
+    alpha: float
+
+
+class ForecastResult(NamedTuple):
+    """
+    Forecasts and holdout scores of every model for a panel of series.
+    Arrays are indexed by (model, series, ...) in the order of models and series
+    """
+    series: np.ndarray
+    models: np.ndarray
+    forecast_dates: np.ndarray
+    holdout_actuals: np.ndarray
+    holdout_predictions: np.ndarray
+    mse: np.ndarray
+    mape: np.ndarray
+    forecasts: np.ndarray
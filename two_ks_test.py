@@ -1,99 +1,85 @@
+import numpy as np
 import pandas as pd
+from scipy.special import kolmogorov
+from ecdf import ECDF
+from results import HypothesisTestResult
 
 
-def generate_ecdf(n):
-    ecdf = []
-    ecdf.append(0)
-    for i in range(n - 1):
-        ecdf.append(ecdf[-1] + (1 / n))
-    return ecdf
+def compute_two_sample_ks(data1, data2, return_table=False):
+    """
+    KS statistic for two samples, evaluated at the distinct values of the second sample.
+    The eCDFs at every point are found with binary search, so the cost is O((n + m) log(n + m)).
 
+    :param data1: values of the first sample, or their ECDF
+    :param data2: values of the second sample, or their ECDF
+    :param return_table: flag to also return the table of eCDF values at every point
+    :return: d, or (d, table) if return_table is set
+    """
+    ecdf1 = data1 if isinstance(data1, ECDF) else ECDF.from_data(data1)
+    ecdf2 = data2 if isinstance(data2, ECDF) else ECDF.from_data(data2)
 
-def get_ecdf_for_point(data, col_name, x, ecdf_col_name, left=False):
-    # point lies to the right of entire distribution
-    if data[col_name].max() < x:
-        return 1
-    # point lies to the left of entire distribution
-    elif data[col_name].min() > x:
-        return 0
-    else:
-        if left:
-            # find ecdf for point that is just before x
-            ecdf = data.loc[data[col_name] < x, ecdf_col_name]
-            val = 0.0 if ecdf.empty else ecdf.max()
-        else:
-            # find ecdf for point that is just after x
-            ecdf = data.loc[data[col_name] >= x, ecdf_col_name]
-            val = 0.0 if ecdf.empty else ecdf.min()
-        return val
-
-
-def two_sample_KS_test(state1_data, state2_data, col_name):
-    # sort the data by column on which we are performing the KS Test
-    state1_data_sorted = state1_data.sort_values(col_name)
-    state2_data_sorted = state2_data.sort_values(col_name)
+    # Take x points from state 2
+    x_vals = ecdf2.values
 
-    # compute ecdf for each distribution
-    state1_data_sorted['eCDF'] = generate_ecdf(state1_data_sorted.shape[0])
-    state2_data_sorted['eCDF'] = generate_ecdf(state2_data_sorted.shape[0])
+    F1_left, F1_right = ecdf1.ks_limits(x_vals)
+    F2_left, F2_right = ecdf2.ks_limits(x_vals)
+    # difference between corresponding left ecdf values
+    abs_diff_left = np.round(np.abs(F1_left - F2_left), 4)
+    # difference between corresponding right ecdf values
+    abs_diff_right = np.round(np.abs(F1_right - F2_right), 4)
 
-    # we keep last value for each x point since that is the one with final ecdf value for that point
-    state1_data_sorted_distinct = state1_data_sorted.drop_duplicates(subset=col_name, keep="last").reset_index(
-        drop=True)
-    state2_data_sorted_distinct = state2_data_sorted.drop_duplicates(subset=col_name, keep="last").reset_index(
-        drop=True)
+    # max of both left and right differences
+    d = max(abs_diff_right.max(), abs_diff_left.max())
+    if not return_table:
+        return d
 
-    # Take x points from state 2
-    x_vals = state2_data_sorted_distinct[col_name].to_numpy()
+    # table for all KS values
+    table_ks = pd.DataFrame({'x': x_vals,
+                             'F1_left': F1_left,
+                             'F1_right': F1_right,
+                             'F2_left': F2_left,
+                             'F2_right': F2_right,
+                             'abs_diff_left': abs_diff_left,
+                             'abs_diff_right': abs_diff_right})
+    return d, table_ks
 
-    ks_values = []
 
-    # compute table column values for each x
-    for x in x_vals:
-        # ecdf to the left of x for state 1's distribution
-        F1_left = get_ecdf_for_point(state1_data_sorted_distinct, col_name, x, 'eCDF', left=True)
-        # ecdf to the right of x for state 1's distribution
-        F1_right = get_ecdf_for_point(state1_data_sorted_distinct, col_name, x, 'eCDF')
-        # ecdf to the left of x for state 2's distribution
-        F2_left = get_ecdf_for_point(state2_data_sorted_distinct, col_name, x, 'eCDF', left=True)
-        # ecdf to the right of x for state 2's distribution
-        F2_right = get_ecdf_for_point(state2_data_sorted_distinct, col_name, x, 'eCDF')
-        # difference between corresponding left ecdf values
-        abs_diff_left = round(abs(F1_left - F2_left), 4)
-        # difference between corresponding right ecdf values
-        abs_diff_right = round(abs(F1_right - F2_right), 4)
+def compute_two_sample_ks_pvalue(d, n, m):
+    """
+    :param d: KS statistic
+    :param n: size of the first sample
+    :param m: size of the second sample
+    :return: asymptotic p-value of d
+    """
+    return kolmogorov(np.sqrt(n * m / (n + m)) * d)
 
-        ks_values.append(
-            {'x': x,
-             'F1_left': F1_left,
-             'F1_right': F1_right,
-             'F2_left': F2_left,
-             'F2_right': F2_right,
-             'abs_diff_left': abs_diff_left,
-             'abs_diff_right': abs_diff_right
-             })
 
-    # table for all KS values
-    table_ks = pd.DataFrame(ks_values, columns=['x', 'F1_left', 'F1_right', 'F2_left', 'F2_right',
-                                                'abs_diff_left', 'abs_diff_right'])
+def two_sample_KS_test(state1_data, state2_data, col_name, reporter=print):
+    """
+    Two sample KS test for the distributions of a column in two states
 
-    # Calculate KS statistic
-    # max of right ecdf values
-    max_d_right = table_ks['abs_diff_right'].max()
-    # max of left ecdf values
-    max_d_left = table_ks['abs_diff_left'].max()
-    # max of both values
-    d = max(max_d_right, max_d_left)
+    :param reporter: function called with each line of the report, None to skip the report
+    :return: HypothesisTestResult, the p-value is the asymptotic one
+    """
+    ecdf1, ecdf2 = ECDF.from_data(state1_data[col_name]), ECDF.from_data(state2_data[col_name])
+    d = compute_two_sample_ks(ecdf1, ecdf2)
     critical_value = 0.05
-    if d > critical_value:
-        print(
+    # sample sizes without the nan values, which the eCDFs skip
+    p_value = compute_two_sample_ks_pvalue(d, ecdf1.n, ecdf2.n)
+    result = HypothesisTestResult(float(d), critical_value, float(p_value), bool(d > critical_value))
+    if reporter is None:
+        return result
+
+    if result.reject_null:
+        reporter(
             "KS Test for col: {} rejects the null hypothesis.\nThe statistic d is {}, which is more than the critical-value: {}".format(
                 col_name, d, critical_value
             ))
-        print()
+        reporter("")
     else:
-        print(
+        reporter(
             "KS Test for col: {} accepts the null hypothesis.\nThe statistic d is {}, which is less than the critical-value: {}".format(
                 col_name, d, critical_value
             ))
-        print()
+        reporter("")
+    return result